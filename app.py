@@ -2,20 +2,92 @@
 import streamlit as st
 import pandas as pd
 import time
+import os
+import io
+import zipfile
+import csv
+import tempfile
 import re # Needed for keyword pattern validation
 
 # Import functions from our modules
 from utils import ensure_nltk_data, get_tokenizer
-from file_processor import extract_sentences_with_structure # Correct import
-from chunker import chunk_structured_sentences, chunk_by_chapter # Correct import
+from tokenizer_registry import DEFAULT_TOKENIZER, calibrate_approximate_tokenizer
+from file_processor import extract_sentences_with_structure, extract_sentences_incremental, preview_heading_detection, \
+    iter_sentences_with_structure
+from chunker import chunk_by_chapter, chunk_hierarchical, parent_text, \
+    chunk_incremental, load_chunk_manifest, save_chunk_manifest # Correct import
+from document_model import DocumentText, SpanRecords, chunk_document, UNKNOWN_CHAPTER
+from token_export import export_token_ids
+from heading_tuner import extract_line_features, auto_tune_heading_criteria
+from chunk_store import open_chunk_store, insert_chunks, search_chunks
+from safe_extraction import extract_sentences_supervised, iter_pages_supervised
+from memory_budget import process_with_memory_budget
 
 # --- Constants ---
 TARGET_TOKENS = 200
 OVERLAP_SENTENCES = 2
+OVERLAP_TOKENS = 40 # Token overlap mode: minimum trailing context
+OVERLAP_CAP_TOKENS = 80 # Token overlap mode: hard cap on the overlap (chunks never exceed TARGET_TOKENS)
+OVERSIZE_OVERLAP_TOKENS = 20 # Token overlap when one sentence alone exceeds TARGET_TOKENS
+PREVIEW_STATUS_STYLES = {'heading': 'background-color: #c8f7c5', 'dropped': 'color: #999999; text-decoration: line-through'}
+PREVIEW_ROWS = 200 # Chunk rows shown on the page; the full CSV is only in the download
+CALIBRATION_SAMPLES = 500 # Sentences used to calibrate the approximate tokenizer
+TOKEN_MODE = 'Chunk by ~200 Tokens (with overlap)'
+TOKENIZER_OPTIONS = ('cl100k_base', 'o200k_base', 'p50k_base', 'HuggingFace tokenizer.json', 'Approximate (draft, no BPE)')
 
 # --- Run Setup ---
 nltk_ready = ensure_nltk_data()
-tokenizer = get_tokenizer()
+
+# --- Chunk Export Helpers ---
+def chunk_row(chunk, columns):
+    return [(chunk.get(c) or UNKNOWN_CHAPTER) if c == 'title' else chunk.get(c) for c in columns]
+
+def chunks_to_csv(chunk_list, columns):
+    """CSV bytes written chunk by chunk, without a DataFrame of all chunks."""
+    buffer = io.BytesIO()
+    text_out = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+    writer = csv.writer(text_out); writer.writerow(columns)
+    for chunk in chunk_list: writer.writerow(chunk_row(chunk, columns))
+    text_out.flush(); text_out.detach()
+    return buffer.getvalue()
+
+def offer_token_export(chunks, tokenizer, source_name):
+    """Token ids for every chunk (flat .bin + offsets + metadata) as a zip download, so consumers skip tokenization."""
+    with tempfile.TemporaryDirectory() as export_dir:
+        export_prefix = os.path.join(export_dir, f"{source_name}_tokens")
+        export_header = export_token_ids(chunks, tokenizer, export_prefix, source=source_name)
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            for export_name in os.listdir(export_dir): zf.write(os.path.join(export_dir, export_name), export_name)
+    if export_header:
+        st.download_button( label=f"Download token ids ({export_header['n_tokens']} tokens, .zip)", data=zip_buffer.getvalue(),
+            file_name=f'{source_name}_tokens_v15.zip', mime='application/zip', key="download_tokens_v15"
+        )
+
+def save_chunks_to_store(chunks, db_path, source_name, tokenizer):
+    store_conn = open_chunk_store(db_path)
+    try: stored = insert_chunks(store_conn, chunks, source_name, tokenizer=tokenizer)
+    finally: store_conn.close()
+    st.success(f"Saved {stored} chunks to {db_path}.")
+
+def iter_csv_chunks(csv_path):
+    """Chunk dictionaries read back from a written CSV one row at a time."""
+    with open(csv_path, newline='', encoding='utf-8') as csv_file: yield from csv.DictReader(csv_file)
+
+# --- Auto-Tune Callback ---
+def apply_tuned_criteria():
+    """Copies the best auto-tuned criteria into the sidebar widgets (runs before the next rerun)."""
+    criteria = st.session_state.get('tuned_criteria')
+    if not criteria: return
+    widget_values = {
+        'use_style': criteria['use_style'], 'use_case': criteria['use_case'], 'use_layout': criteria['use_layout'],
+        'use_length': criteria['use_length'], 'use_kw': criteria['use_keywords'],
+        'req_bold': criteria['require_bold'], 'req_italic': criteria['require_italic'],
+        'req_title': criteria['require_title_case'], 'req_caps': criteria['require_all_caps'],
+        'req_center': criteria['require_centered'], 'req_isolate': criteria['require_isolated'],
+        'min_w': criteria['min_words'], 'max_w': criteria['max_words'],
+    }
+    for key, value in widget_values.items(): st.session_state[key] = value
 
 # --- Streamlit App UI ---
 st.title("PDF/DOCX Configurable Chunker v15")
@@ -76,10 +148,44 @@ keyword_pattern = st.text_input("Regex Pattern (optional, case-insensitive)", va
 st.sidebar.subheader("Chunking Method")
 chunk_mode = st.sidebar.radio(
     "Select Chunking Mode:",
-    ('Chunk by ~200 Tokens (with overlap)', 'Chunk by Detected Chapter Title'),
+    (TOKEN_MODE, 'Chunk by Detected Chapter Title', 'Hierarchical (Chapter Parents + Token Children)'),
     key='chunk_mode_select_v15'
 )
 include_page_numbers = st.sidebar.checkbox("Include Page/Para Marker?", value=True, key='page_num_toggle_v15')
+overlap_mode = st.sidebar.radio("Overlap Mode:", (f'{OVERLAP_SENTENCES} Sentences', 'Tokens'), key='overlap_mode', horizontal=True)
+col1d, col2d = st.sidebar.columns(2)
+with col1d:
+    overlap_tokens_input = st.number_input("Min Overlap Tokens", min_value=0, value=OVERLAP_TOKENS, step=5, key='overlap_tok', disabled=overlap_mode != 'Tokens')
+with col2d:
+    overlap_cap_input = st.number_input("Overlap Cap Tokens", min_value=0, value=OVERLAP_CAP_TOKENS, step=5, key='overlap_cap', disabled=overlap_mode != 'Tokens')
+overlap_kwargs = {"overlap_tokens": int(overlap_tokens_input), "overlap_cap_tokens": int(overlap_cap_input)} if overlap_mode == 'Tokens' else {}
+tokenizer_choice = st.sidebar.selectbox("Tokenizer", TOKENIZER_OPTIONS, key='tokenizer_select',
+    help="Approximate mode estimates tokens from character/word counts calibrated on the document; use for fast drafts.")
+hf_tokenizer_path = st.sidebar.text_input("Path to tokenizer.json", value="", key='hf_tok_path',
+    disabled=tokenizer_choice != 'HuggingFace tokenizer.json')
+
+use_incremental = st.sidebar.checkbox("Incremental Re-processing (reuse unchanged pages)", value=False, key='incremental_toggle',
+    help="Caches extracted pages by content hash; a revised edition only re-extracts changed pages and keeps unchanged chunk IDs.")
+cache_dir = st.sidebar.text_input("Cache Directory", value=".chunk_cache", key='cache_dir', disabled=not use_incremental)
+book_key = st.sidebar.text_input("Book Key (blank = file name)", value="", key='book_key', disabled=not use_incremental,
+    help="Chunk reuse is tracked per book key. Pages are reused under any file name, but chunks only when the key matches, "
+         "so give a renamed edition the previous file name here.")
+save_to_store = st.sidebar.checkbox("Save Chunks to SQLite Store", value=False, key='store_toggle',
+    help="Upserts chunks into a local SQLite database with a full-text (FTS5) index; search it below.")
+store_path = st.sidebar.text_input("Chunk Store Path", value="chunks.db", key='store_path')
+memory_budget_mb = st.sidebar.number_input("Memory Budget (MB, 0 = off)", min_value=0, value=0, step=256, key='memory_budget',
+    help="Token mode only: buffers items up to the budget, then chunks and writes them to the CSV segment by segment; reports peak RSS per stage.")
+
+# --- Tokenizer Setup ---
+use_approximate = tokenizer_choice == 'Approximate (draft, no BPE)'
+if tokenizer_choice == 'HuggingFace tokenizer.json': tokenizer_name = hf_tokenizer_path.strip()
+elif use_approximate: tokenizer_name = DEFAULT_TOKENIZER # Reference for calibration
+else: tokenizer_name = tokenizer_choice
+tokenizer = get_tokenizer(tokenizer_name) if tokenizer_name else None
+token_export_available = chunk_mode != 'Chunk by Detected Chapter Title' and not use_approximate and tokenizer is not None
+export_tokens = st.sidebar.checkbox("Export Token IDs (.zip)", value=False, key='token_export_toggle', disabled=not token_export_available,
+    help="Re-encodes every chunk into a flat .bin + offsets download. Needs a real tokenizer (not Approximate) and a token chunking mode.")
+export_tokens = export_tokens and token_export_available
 
 # --- PDF Specific Options ---
 st.sidebar.markdown("---")
@@ -87,39 +193,93 @@ st.sidebar.markdown("**PDF Specific Options (ignored for DOCX):**")
 start_skip = st.sidebar.number_input("Pages to Skip at START", min_value=0, value=0, step=1)
 end_skip = st.sidebar.number_input("Pages to Skip at END", min_value=0, value=0, step=1)
 start_page_offset = st.sidebar.number_input("Actual Page # of FIRST Processed Page", min_value=1, value=1, step=1)
+preview_pages = st.sidebar.number_input("Preview Sample Pages", min_value=1, value=20, step=5,
+    help="Pages read by 'Preview Heading Detection': the first pages after the skip, then every k-th page.")
+isolate_pages = st.sidebar.checkbox("Isolate Pages in Worker Processes", value=False, key='isolate_toggle',
+    help="Each page runs in a supervised worker with a time and memory limit; pages that hang or crash are skipped and listed.")
+col1e, col2e = st.sidebar.columns(2)
+with col1e: page_timeout = st.number_input("Page Timeout (s)", min_value=1, value=30, step=5, key='page_timeout', disabled=not isolate_pages)
+with col2e: page_memory_mb = st.number_input("Worker Memory (MB)", min_value=256, value=2048, step=256, key='page_mem', disabled=not isolate_pages)
 
 
 # --- Main App Logic ---
 if not tokenizer: st.error("Tokenizer failed to load.")
 elif not nltk_ready: st.error("NLTK 'punkt' data could not be verified/downloaded.")
 elif uploaded_file is not None:
-    if st.button("Process File", key="chunk_button_v15"):
+    # --- Compile Heading Criteria Dictionary ---
+    # (Make sure all variables like require_bold etc. are defined from UI above)
+    heading_criteria = {
+        "require_bold": require_bold if use_style else False,
+        "require_italic": require_italic if use_style else False,
+        "require_title_case": require_title_case if use_case else False,
+        "require_all_caps": require_all_caps if use_case else False,
+        "require_centered": require_centered if use_layout else False,
+        "require_isolated": require_isolated if use_layout else False,
+        "min_words": min_words if use_length else 1,
+        "max_words": max_words if use_length else 50, # Default high max if not used
+        "keyword_pattern": keyword_pattern.strip() if use_keywords and keyword_pattern.strip() else None
+        # Pass the master toggles too, in case the heuristic function needs them
+        ,"use_style": use_style
+        ,"use_case": use_case
+        ,"use_layout": use_layout
+        ,"use_length": use_length
+        ,"use_keywords": use_keywords
+    }
+
+    # Validate Regex if used
+    if heading_criteria["keyword_pattern"]:
+         try: re.compile(heading_criteria["keyword_pattern"], re.IGNORECASE)
+         except re.error as e:
+              st.error(f"Invalid Regex in Keyword Pattern: {e}"); st.stop()
+
+    # --- Sampled Preview (fast heading-criteria check) ---
+    if st.button("Preview Heading Detection (Sampled Pages)", key="preview_button"):
+        preview_is_pdf = uploaded_file.name.lower().endswith(".pdf")
+        start_time = time.time()
+        preview_rows = preview_heading_detection(
+            uploaded_file.name, uploaded_file.getvalue(), heading_criteria,
+            start_skip=int(start_skip) if preview_is_pdf else 0,
+            end_skip=int(end_skip) if preview_is_pdf else 0,
+            start_page_offset=int(start_page_offset) if preview_is_pdf else 1,
+            n_samples=int(preview_pages)
+        )
+        preview_time = time.time() - start_time
+        if preview_rows is None: st.error("Preview failed.")
+        elif not preview_rows: st.warning("No text found on the sampled pages.")
+        else:
+            preview_df = pd.DataFrame(preview_rows)
+            status_counts = preview_df['status'].value_counts()
+            st.write(f"Previewed {preview_df['page_number'].nunique()} sampled pages/paragraphs in {preview_time:.2f} seconds: "
+                     f"{status_counts.get('heading', 0)} headings, {status_counts.get('dropped', 0)} dropped as metadata/footer.")
+            st.dataframe(preview_df.style.apply(lambda row: [PREVIEW_STATUS_STYLES.get(row['status'], '')] * len(row), axis=1))
+
+    # --- Auto-Tune Heading Criteria (parse once, score all combinations) ---
+    if st.button("Auto-Tune Heading Criteria", key="autotune_button"):
+        tune_is_pdf = uploaded_file.name.lower().endswith(".pdf")
+        with st.spinner("Reading layout features and scoring heading criteria..."):
+            start_time = time.time()
+            line_features = extract_line_features(
+                uploaded_file.name, uploaded_file.getvalue(),
+                start_skip=int(start_skip) if tune_is_pdf else 0,
+                end_skip=int(end_skip) if tune_is_pdf else 0,
+                start_page_offset=int(start_page_offset) if tune_is_pdf else 1
+            )
+            tuning_results = auto_tune_heading_criteria(line_features)
+            tune_time = time.time() - start_time
+        if not tuning_results: st.error("Auto-tune found no candidate heading lines.")
+        else:
+            st.session_state['tuned_criteria'] = tuning_results[0]['heading_criteria']
+            st.session_state['tuning_results'] = tuning_results
+            st.write(f"Auto-tune took: {tune_time:.2f} seconds" + (" (PDF outline used for scoring)" if line_features['outline'] else ""))
+    if st.session_state.get('tuning_results'):
+        st.dataframe(pd.DataFrame([
+            {"score": r['score'], **r['signals'],
+             **{k: v for k, v in r['heading_criteria'].items() if k.startswith('require_') or k.endswith('_words')}}
+            for r in st.session_state['tuning_results']
+        ]))
+        st.button("Apply Best Criteria to Sidebar", key="apply_tuned_button", on_click=apply_tuned_criteria)
 
-        # --- Compile Heading Criteria Dictionary ---
-        # (Make sure all variables like require_bold etc. are defined from UI above)
-        heading_criteria = {
-            "require_bold": require_bold if use_style else False,
-            "require_italic": require_italic if use_style else False,
-            "require_title_case": require_title_case if use_case else False,
-            "require_all_caps": require_all_caps if use_case else False,
-            "require_centered": require_centered if use_layout else False,
-            "require_isolated": require_isolated if use_layout else False,
-            "min_words": min_words if use_length else 1,
-            "max_words": max_words if use_length else 50, # Default high max if not used
-            "keyword_pattern": keyword_pattern.strip() if use_keywords and keyword_pattern.strip() else None
-            # Pass the master toggles too, in case the heuristic function needs them
-            ,"use_style": use_style
-            ,"use_case": use_case
-            ,"use_layout": use_layout
-            ,"use_length": use_length
-            ,"use_keywords": use_keywords
-        }
-
-        # Validate Regex if used
-        if heading_criteria["keyword_pattern"]:
-             try: re.compile(heading_criteria["keyword_pattern"], re.IGNORECASE)
-             except re.error as e:
-                  st.error(f"Invalid Regex in Keyword Pattern: {e}"); st.stop()
+    if st.button("Process File", key="chunk_button_v15"):
 
         # --- Get File Info & Display Settings ---
         file_content = uploaded_file.getvalue()
@@ -135,69 +295,201 @@ elif uploaded_file is not None:
         settings_info = f"Chunk Mode: '{chunk_mode}' | Include Loc#: {include_page_numbers} | Heading Criteria: {', '.join(active_criteria_summary) if active_criteria_summary else 'None Active'}"
         if is_pdf: settings_info += f" | PDF Skip: {start_skip} start, {end_skip} end | PDF Offset: {start_page_offset}"
         st.info(settings_info)
+        use_memory_budget = memory_budget_mb > 0 and chunk_mode == TOKEN_MODE and not use_incremental
 
-        # --- Extraction ---
-        with st.spinner("Step 1: Reading file and extracting structure..."):
-            start_time = time.time()
-            sentences_data = extract_sentences_with_structure(
-                file_name=file_name,
-                file_content=file_content,
-                heading_criteria=heading_criteria, # Pass the dictionary
-                start_skip=int(start_skip) if is_pdf else 0,
-                end_skip=int(end_skip) if is_pdf else 0,
-                start_page_offset=int(start_page_offset) if is_pdf else 1
-            )
-            extract_time = time.time() - start_time
-            st.write(f"Extraction took: {extract_time:.2f} seconds")
-
-        # --- Chunking and Output ---
-        if sentences_data is None: st.error("Failed to extract data.")
-        elif not sentences_data: st.warning("No text content found.")
+        if use_memory_budget:
+            # --- Memory-Budgeted Run: extract, chunk and write the CSV segment by segment ---
+            with st.spinner(f"Processing within a {int(memory_budget_mb)} MB budget..."):
+                csv_fd, csv_path = tempfile.mkstemp(suffix=".csv")
+                os.close(csv_fd)
+                failed_pages = []
+                budget_pages = iter_pages_supervised(
+                    file_name, file_content, heading_criteria, int(start_skip), int(end_skip), int(start_page_offset),
+                    page_timeout=float(page_timeout), memory_limit_mb=int(page_memory_mb), failed_pages=failed_pages
+                ) if isolate_pages and is_pdf else None
+                try:
+                    budget_summary = process_with_memory_budget(
+                        file_name, file_content, heading_criteria, tokenizer, csv_path,
+                        int(memory_budget_mb), TARGET_TOKENS, OVERLAP_SENTENCES, OVERSIZE_OVERLAP_TOKENS,
+                        start_skip=int(start_skip) if is_pdf else 0,
+                        end_skip=int(end_skip) if is_pdf else 0,
+                        start_page_offset=int(start_page_offset) if is_pdf else 1,
+                        include_page_numbers=include_page_numbers, calibrate=use_approximate, pages=budget_pages, **overlap_kwargs
+                    )
+                    if failed_pages:
+                        st.warning(f"{len(failed_pages)} page(s) could not be extracted and were skipped.")
+                        st.dataframe(pd.DataFrame(sorted(failed_pages, key=lambda f: f["page_number"])), hide_index=True)
+                    if budget_summary is None: st.error("Failed to extract data.")
+                    elif not budget_summary["chunks"]: st.error("Chunking resulted in no data.")
+                    else:
+                        st.success(f"Processing complete. {budget_summary['items']} items, {budget_summary['chunks']} chunks "
+                                   f"written in {budget_summary['flushes']} segments ({budget_summary['forced_flushes']} mid-chapter). "
+                                   f"Peak buffer {budget_summary['peak_buffer_mb']} MB, peak RSS {budget_summary['peak_rss_mb']} MB.")
+                        st.dataframe(pd.DataFrame(budget_summary["stages"]), hide_index=True)
+                        st.dataframe(pd.read_csv(csv_path, nrows=PREVIEW_ROWS))
+                        with open(csv_path, "rb") as csv_file:
+                            st.download_button( label="Download data as CSV", data=csv_file,
+                                file_name=f'{uploaded_file.name}_chunks_v15.csv', mime='text/csv', key="download_csv_v15"
+                            )
+                        # Token ids and the store are fed from the written CSV row by row, so the budget still holds
+                        if export_tokens: offer_token_export(iter_csv_chunks(csv_path), tokenizer, uploaded_file.name)
+                        if save_to_store: save_chunks_to_store(iter_csv_chunks(csv_path), store_path, uploaded_file.name, None if use_approximate else tokenizer)
+                finally:
+                    os.remove(csv_path)
         else:
-            st.success(f"Extracted {len(sentences_data)} items.")
-            # --- Conditional Chunking ---
-            # (Keep the rest of the chunking/output logic exactly as in v15)
-            if chunk_mode == 'Chunk by Detected Chapter Title':
-                with st.spinner("Step 2: Chunking by chapter title..."):
-                    start_time = time.time()
-                    # Assumes extract_sentences returns (text, marker, chapter_title_or_None)
-                    chunk_list = chunk_by_chapter(sentences_data) # Needs the right input format
-                    chunk_time = time.time() - start_time
-                    st.write(f"Chapter chunking took: {chunk_time:.2f} seconds")
-                output_columns = ['title', 'chunk_text']
-            else: # Default to token-based chunking
-                 with st.spinner(f"Step 2: Chunking into ~{TARGET_TOKENS} token chunks..."):
-                    start_time = time.time()
-                    # Assumes extract_sentences returns (text, marker, chapter_title_or_None)
-                    # This call assumes chunker handles 3-item tuples
-                    chunk_list = chunk_structured_sentences(
-                        sentences_data, tokenizer, TARGET_TOKENS, OVERLAP_SENTENCES
+            # --- Extraction ---
+            with st.spinner("Step 1: Reading file and extracting structure..."):
+                start_time = time.time()
+                if use_incremental:
+                    sentences_data, page_stats = extract_sentences_incremental(
+                        file_name=file_name,
+                        file_content=file_content,
+                        heading_criteria=heading_criteria,
+                        cache_dir=cache_dir,
+                        start_skip=int(start_skip) if is_pdf else 0,
+                        end_skip=int(end_skip) if is_pdf else 0,
+                        start_page_offset=int(start_page_offset) if is_pdf else 1
+                    )
+                    if page_stats["pages"]: st.write(f"Pages reused from cache: {page_stats['reused_pages']} / {page_stats['pages']}")
+                elif isolate_pages and is_pdf:
+                    sentences_data, failed_pages = extract_sentences_supervised(
+                        file_name=file_name,
+                        file_content=file_content,
+                        heading_criteria=heading_criteria,
+                        start_skip=int(start_skip),
+                        end_skip=int(end_skip),
+                        start_page_offset=int(start_page_offset),
+                        page_timeout=float(page_timeout),
+                        memory_limit_mb=int(page_memory_mb)
                     )
-                    chunk_time = time.time() - start_time
-                    st.write(f"Token chunking took: {chunk_time:.2f} seconds")
-                 output_columns = ['chunk_text', 'page_number', 'title']
-
-            # --- Process Results ---
-            if chunk_list:
-                st.success(f"Processing complete. Generated {len(chunk_list)} chunks.")
-                df = pd.DataFrame(chunk_list)
-                if 'title' not in df.columns: df['title'] = "Unknown"
-                df['title'] = df['title'].fillna("Unknown Chapter / Front Matter")
-
-                final_columns = []
-                if 'chunk_text' in df.columns: final_columns.append('chunk_text')
-                if include_page_numbers and 'page_number' in df.columns: final_columns.append('page_number')
-                if 'title' in df.columns: final_columns.append('title')
-
-                if not final_columns or 'chunk_text' not in final_columns : st.error("Error processing columns.")
+                    if failed_pages:
+                        st.warning(f"{len(failed_pages)} page(s) could not be extracted and were skipped.")
+                        st.dataframe(pd.DataFrame(failed_pages), hide_index=True)
+                elif chunk_mode == TOKEN_MODE:
+                    # Items stream from the pages straight into the compact model; no tuple list is kept
+                    try: sentences_data = DocumentText.from_items(iter_sentences_with_structure(
+                        file_name, file_content, heading_criteria,
+                        int(start_skip) if is_pdf else 0, int(end_skip) if is_pdf else 0, int(start_page_offset) if is_pdf else 1
+                    ))
+                    except Exception as e_main: print(e_main); sentences_data = None
                 else:
-                    df_display = df[final_columns]
-                    st.dataframe(df_display)
-                    csv_data = df_display.to_csv(index=False).encode('utf-8')
-                    st.download_button( label="Download data as CSV", data=csv_data,
-                        file_name=f'{uploaded_file.name}_chunks_v15.csv', mime='text/csv', key="download_csv_v15"
+                    sentences_data = extract_sentences_with_structure(
+                        file_name=file_name,
+                        file_content=file_content,
+                        heading_criteria=heading_criteria, # Pass the dictionary
+                        start_skip=int(start_skip) if is_pdf else 0,
+                        end_skip=int(end_skip) if is_pdf else 0,
+                        start_page_offset=int(start_page_offset) if is_pdf else 1
                     )
-            else: st.error("Chunking resulted in no data.")
+                extract_time = time.time() - start_time
+                st.write(f"Extraction took: {extract_time:.2f} seconds")
+
+            # --- Chunking and Output ---
+            if sentences_data is None: st.error("Failed to extract data.")
+            elif not sentences_data: st.warning("No text content found.")
+            else:
+                st.success(f"Extracted {len(sentences_data)} items.")
+                if use_approximate:
+                    # Calibrate on a sample of this document, then chunk without BPE encoding
+                    stride = max(1, len(sentences_data) // CALIBRATION_SAMPLES)
+                    calibration_texts = [sentences_data[i][0] for i in range(0, len(sentences_data), stride) if sentences_data[i][2] is None]
+                    tokenizer = calibrate_approximate_tokenizer(calibration_texts, tokenizer)
+                    stats = tokenizer.error_stats
+                    if stats:
+                        st.info(f"Approximate token counts (calibrated on {stats['samples']} sentences): "
+                                f"mean error {stats['mean_abs_rel_error']:.1%}, p95 {stats['p95_abs_rel_error']:.1%}, "
+                                f"max {stats['max_abs_rel_error']:.1%}, total {stats['total_rel_error']:+.1%}")
+                # --- Conditional Chunking ---
+                # (Keep the rest of the chunking/output logic exactly as in v15)
+                if chunk_mode == 'Chunk by Detected Chapter Title':
+                    with st.spinner("Step 2: Chunking by chapter title..."):
+                        start_time = time.time()
+                        # Assumes extract_sentences returns (text, marker, chapter_title_or_None)
+                        chunk_list = chunk_by_chapter(sentences_data) # Needs the right input format
+                        chunk_time = time.time() - start_time
+                        st.write(f"Chapter chunking took: {chunk_time:.2f} seconds")
+                    output_columns = ['title', 'chunk_text']
+                elif chunk_mode == 'Hierarchical (Chapter Parents + Token Children)':
+                    with st.spinner(f"Step 2: Building chapter parents and ~{TARGET_TOKENS} token children..."):
+                        start_time = time.time()
+                        hierarchy = chunk_hierarchical(
+                            sentences_data, tokenizer, TARGET_TOKENS, OVERLAP_SENTENCES,
+                            oversize_overlap_tokens=OVERSIZE_OVERLAP_TOKENS, **overlap_kwargs
+                        )
+                        chunk_list = hierarchy["children"] if hierarchy else []
+                        chunk_time = time.time() - start_time
+                        st.write(f"Hierarchical chunking took: {chunk_time:.2f} seconds")
+                    output_columns = ['chunk_id', 'parent_id', 'chunk_text', 'page_number', 'title', 'start_char', 'end_char']
+                else: # Default to token-based chunking
+                     with st.spinner(f"Step 2: Chunking into ~{TARGET_TOKENS} token chunks..."):
+                        start_time = time.time()
+                        # Assumes extract_sentences returns (text, marker, chapter_title_or_None)
+                        # This call assumes chunker handles 3-item tuples
+                        if use_incremental:
+                            manifest_key = re.sub(r"[^\w.-]", "_", book_key.strip()) or os.path.basename(file_name)
+                            manifest_path = os.path.join(cache_dir, f"{manifest_key}.manifest.json")
+                            chunk_list, manifest, chunk_stats = chunk_incremental(
+                                sentences_data, tokenizer, TARGET_TOKENS, OVERLAP_SENTENCES,
+                                previous_manifest=load_chunk_manifest(manifest_path),
+                                oversize_overlap_tokens=OVERSIZE_OVERLAP_TOKENS, **overlap_kwargs
+                            )
+                            os.makedirs(cache_dir, exist_ok=True)
+                            save_chunk_manifest(manifest_path, manifest)
+                            st.write(f"Chunks reused: {chunk_stats['reused_chunks']} | re-chunked: {chunk_stats['new_chunks']}")
+                        else:
+                            # Compact model: one text buffer + array offsets; chunks are spans until export
+                            if not isinstance(sentences_data, DocumentText): sentences_data = DocumentText.from_items(sentences_data)
+                            chunk_spans = chunk_document(
+                                sentences_data, tokenizer, TARGET_TOKENS, OVERLAP_SENTENCES,
+                                oversize_overlap_tokens=OVERSIZE_OVERLAP_TOKENS, **overlap_kwargs
+                            )
+                            chunk_list = SpanRecords(sentences_data, chunk_spans) # Records are built while writing, not kept
+                        chunk_time = time.time() - start_time
+                        st.write(f"Token chunking took: {chunk_time:.2f} seconds")
+                     output_columns = ['chunk_id', 'chunk_text', 'page_number', 'title']
+
+                # --- Process Results ---
+                if chunk_list:
+                    st.success(f"Processing complete. Generated {len(chunk_list)} chunks.")
+                    first_chunk = chunk_list[0]
+                    final_columns = []
+                    for id_col in ('chunk_id', 'parent_id'):
+                        if id_col in output_columns and id_col in first_chunk: final_columns.append(id_col)
+                    if 'chunk_text' in first_chunk: final_columns.append('chunk_text')
+                    if include_page_numbers and 'page_number' in first_chunk: final_columns.append('page_number')
+                    final_columns.append('title')
+                    for offset_col in ('start_char', 'end_char'):
+                        if offset_col in output_columns and offset_col in first_chunk: final_columns.append(offset_col)
+
+                    if 'chunk_text' not in final_columns: st.error("Error processing columns.")
+                    else:
+                        if len(chunk_list) > PREVIEW_ROWS: st.caption(f"Showing the first {PREVIEW_ROWS} of {len(chunk_list)} chunks; the CSV has all of them.")
+                        st.dataframe(pd.DataFrame([chunk_row(chunk_list[i], final_columns) for i in range(min(PREVIEW_ROWS, len(chunk_list)))], columns=final_columns))
+                        st.download_button( label="Download data as CSV", data=chunks_to_csv(chunk_list, final_columns),
+                            file_name=f'{uploaded_file.name}_chunks_v15.csv', mime='text/csv', key="download_csv_v15"
+                        )
+                        if export_tokens: offer_token_export(chunk_list, tokenizer, uploaded_file.name)
+                        if save_to_store: save_chunks_to_store(chunk_list, store_path, uploaded_file.name, None if use_approximate else tokenizer)
+                        if chunk_mode == 'Hierarchical (Chapter Parents + Token Children)' and hierarchy:
+                            # Parents are offsets into the shared buffer; only materialized here for export
+                            parents_df = pd.DataFrame([
+                                {**p, "parent_text": parent_text(hierarchy["text_buffer"], p)} for p in hierarchy["parents"]
+                            ])
+                            st.write(f"{len(parents_df)} chapter parents.")
+                            st.download_button( label="Download parents as CSV", data=parents_df.to_csv(index=False).encode('utf-8'),
+                                file_name=f'{uploaded_file.name}_parents_v15.csv', mime='text/csv', key="download_parents_csv_v15"
+                            )
+                else: st.error("Chunking resulted in no data.")
+
+# --- Chunk Store Search ---
+st.markdown("---")
+search_query = st.text_input("Search Chunk Store", value="", key='store_search', help="Words, \"phrases\", prefix*, AND/OR/NEAR.")
+if search_query.strip():
+    store_conn = open_chunk_store(store_path)
+    try: search_results = search_chunks(store_conn, search_query, limit=50)
+    finally: store_conn.close()
+    if search_results: st.dataframe(pd.DataFrame(search_results)[['source', 'page_number', 'title', 'snippet', 'chunk_id']])
+    else: st.info("No matching chunks.")
 
 
 # --- END OF FILE app.py ---
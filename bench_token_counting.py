@@ -0,0 +1,56 @@
+# --- START OF FILE bench_token_counting.py ---
+"""
+Benchmarks exact vs approximate token counting on a plain-text document.
+Usage: python bench_token_counting.py book.txt [--encoding cl100k_base] [--samples 500]
+"""
+import argparse
+import time
+import nltk
+
+from tokenizer_registry import load_tokenizer, calibrate_approximate_tokenizer, DEFAULT_TOKENIZER
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exact vs approximate token counting benchmark.")
+    parser.add_argument("text_file")
+    parser.add_argument("--encoding", default=DEFAULT_TOKENIZER, help="tiktoken encoding name or tokenizer.json path")
+    parser.add_argument("--samples", type=int, default=500, help="Sentences used to calibrate the approximation")
+    args = parser.parse_args()
+
+    with open(args.text_file, encoding="utf-8") as f: text = f.read()
+    sentences = [s.strip() for s in nltk.sent_tokenize(text) if s.strip()]
+    if not sentences: print("No sentences found."); return
+    exact_tokenizer = load_tokenizer(args.encoding)
+
+    start_time = time.perf_counter()
+    exact_counts = [len(exact_tokenizer.encode(s)) for s in sentences]
+    exact_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    approx = calibrate_approximate_tokenizer(sentences, exact_tokenizer, max_samples=args.samples)
+    calibrate_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    approx_counts = [approx.count(s) for s in sentences]
+    approx_time = time.perf_counter() - start_time
+
+    # Error bounds over the whole document (calibration sample included)
+    rel_errors = sorted(abs(a - e) / e for a, e in zip(approx_counts, exact_counts) if e > 0)
+    total_exact = sum(exact_counts); total_approx = sum(approx_counts)
+    pct = lambda q: rel_errors[min(len(rel_errors) - 1, int(q * len(rel_errors)))] if rel_errors else 0.0
+
+    print(f"Sentences: {len(sentences)} | Exact tokens ({args.encoding}): {total_exact}")
+    print(f"Exact counting:  {exact_time:.3f}s")
+    print(f"Approx counting: {approx_time:.3f}s (+ {calibrate_time:.3f}s calibration) | "
+          f"tokens ~ {approx.chars_coef:.4f}*chars + {approx.words_coef:.4f}*words")
+    print(f"Calibration sample ({approx.error_stats.get('samples', 0)}): "
+          f"mean {approx.error_stats.get('mean_abs_rel_error', 0):.2%}, p95 {approx.error_stats.get('p95_abs_rel_error', 0):.2%}, "
+          f"max {approx.error_stats.get('max_abs_rel_error', 0):.2%}")
+    print(f"Per-sentence error (all): mean {sum(rel_errors) / max(1, len(rel_errors)):.2%}, "
+          f"p50 {pct(0.5):.2%}, p95 {pct(0.95):.2%}, p99 {pct(0.99):.2%}, max {pct(1.0):.2%}")
+    print(f"Document total error: {(total_approx - total_exact) / max(1, total_exact):+.2%}")
+
+
+if __name__ == "__main__":
+    main()
+# --- END OF FILE bench_token_counting.py ---
@@ -0,0 +1,316 @@
+# --- START OF FILE chunk_service.py ---
+"""
+Local HTTP chunking service (stdlib http.server) in front of a pre-warmed worker process pool.
+Usage:
+    python chunk_service.py [--port 8765] [--workers 2] [--queue-size 8] [--tokenizer cl100k_base] [--path-root /books]
+                            [--page-timeout 30]
+
+Endpoints:
+    POST /chunk?file_name=book.pdf&mode=token&target_tokens=200   raw PDF/DOCX bytes as the request body
+    POST /chunk   Content-Type: application/json
+                  {"path": "book.pdf", "heading_criteria": {...}, "mode": "token", "target_tokens": 200, ...}
+                  (paths only with --path-root, and only inside it)
+    GET  /health  worker count, queue depth, counters and latency percentiles
+
+/chunk answers with NDJSON: one {"record": "chunk", ...} line per chunk ({"record": "parent", ...} lines
+first in hierarchical mode), then a final {"record": "summary", ...} line. When all workers are busy and
+the queue is full the service answers 503 with Retry-After instead of queueing more work.
+PDF pages are extracted in supervised processes with a per-page timeout (see safe_extraction), so every
+job finishes: a page that hangs MuPDF is killed and listed in the summary's "failed_pages".
+"""
+import os
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from tokenizer_registry import DEFAULT_TOKENIZER, APPROXIMATE_TOKENIZER, load_tokenizer, calibrate_approximate_tokenizer
+from safe_extraction import extract_sentences_supervised, DEFAULT_PAGE_TIMEOUT
+from chunker import chunk_by_chapter, chunk_hierarchical, parent_text
+from document_model import DocumentText, chunk_document, iter_span_records
+
+# --- Defaults (same as app.py) ---
+TARGET_TOKENS = 200
+OVERLAP_SENTENCES = 2
+OVERSIZE_OVERLAP_TOKENS = 20
+DEFAULT_HEADING_CRITERIA = {
+    "require_bold": False, "require_italic": True,
+    "require_title_case": True, "require_all_caps": False,
+    "require_centered": True, "require_isolated": True,
+    "min_words": 1, "max_words": 10, "keyword_pattern": None,
+    "use_style": True, "use_case": True, "use_layout": True, "use_length": True, "use_keywords": False
+}
+CHUNK_MODES = ("token", "chapter", "hierarchical")
+INT_PARAMS = { # Chunk parameter -> smallest accepted value (None: any integer)
+    "target_tokens": 1, "overlap_sentences": 0, "oversize_overlap_tokens": 0, "overlap_tokens": 0, "overlap_cap_tokens": 0,
+    "start_skip": 0, "end_skip": 0, "start_page_offset": None
+}
+MAX_UPLOAD_MB = 200
+JOB_TIMEOUT = 600 # Seconds a request waits for its result
+LATENCY_WINDOW = 1000 # Recent requests kept for percentiles
+
+# --- Worker Process Side ---
+_worker_tokenizer = None
+_worker_page_timeout = DEFAULT_PAGE_TIMEOUT
+_page_start_method = "spawn"
+
+
+def _init_worker(tokenizer_name, page_timeout=DEFAULT_PAGE_TIMEOUT):
+    """Pool initializer: loads the tokenizer and the punkt model once per worker process."""
+    global _worker_tokenizer, _worker_page_timeout, _page_start_method
+    _worker_page_timeout = page_timeout
+    if "forkserver" in multiprocessing.get_all_start_methods(): # Page processes fork from a server with the modules loaded
+        multiprocessing.set_forkserver_preload(["safe_extraction"]); _page_start_method = "forkserver"
+    # Approximate mode keeps the default encoding as its per-document calibration reference
+    _worker_tokenizer = load_tokenizer(DEFAULT_TOKENIZER if tokenizer_name == APPROXIMATE_TOKENIZER else tokenizer_name)
+    try:
+        import nltk
+        nltk.sent_tokenize("Warm up. The sentence model.") # Loads punkt into this process
+    except Exception as e: print(f"Warn: NLTK punkt not loaded in worker ({e}); sentence splitting will fall back.")
+
+
+def _warm_worker(delay):
+    time.sleep(delay) # Keeps this worker busy so the pool starts the next one
+    return os.getpid()
+
+
+def _chunk_job(file_name, file_content, path, heading_criteria, params, approximate):
+    """
+    Runs extraction and chunking in a worker process. PDF pages are extracted one at a time in a
+    supervised child process with a timeout, so a hanging page cannot keep the job (and its slot) forever.
+    Output: (list of NDJSON-ready records, summary dictionary); records is None if extraction failed.
+    """
+    if path is not None:
+        with open(path, "rb") as f: file_content = f.read()
+    start_time = time.perf_counter()
+    sentences_data, failed_pages = extract_sentences_supervised(
+        file_name, file_content, heading_criteria,
+        params.get("start_skip", 0), params.get("end_skip", 0), params.get("start_page_offset", 1),
+        n_workers=1, page_timeout=_worker_page_timeout, start_method=_page_start_method
+    )
+    extract_seconds = time.perf_counter() - start_time
+    if sentences_data is None: return None, {"error": "Failed to extract data."}
+
+    tokenizer = _worker_tokenizer
+    if approximate and sentences_data:
+        tokenizer = calibrate_approximate_tokenizer([t for t, _, ch in sentences_data if ch is None], _worker_tokenizer)
+    target_tokens = params.get("target_tokens", TARGET_TOKENS)
+    overlap_sentences = params.get("overlap_sentences", OVERLAP_SENTENCES)
+    chunk_kwargs = {"oversize_overlap_tokens": params.get("oversize_overlap_tokens", OVERSIZE_OVERLAP_TOKENS)}
+    if params.get("overlap_tokens") is not None:
+        chunk_kwargs.update(overlap_tokens=params["overlap_tokens"], overlap_cap_tokens=params.get("overlap_cap_tokens"))
+
+    start_time = time.perf_counter()
+    records = []
+    if not sentences_data: pass
+    elif params["mode"] == "chapter":
+        records = [{"record": "chunk", **c} for c in chunk_by_chapter(sentences_data)]
+    elif params["mode"] == "hierarchical":
+        hierarchy = chunk_hierarchical(sentences_data, tokenizer, target_tokens, overlap_sentences, **chunk_kwargs)
+        if hierarchy:
+            records = [{"record": "parent", **p, "parent_text": parent_text(hierarchy["text_buffer"], p)} for p in hierarchy["parents"]]
+            records += [{"record": "chunk", **c} for c in hierarchy["children"]]
+    else:
+        doc_text = DocumentText.from_items(sentences_data)
+        spans = chunk_document(doc_text, tokenizer, target_tokens, overlap_sentences, **chunk_kwargs)
+        records = [{"record": "chunk", **c} for c in iter_span_records(doc_text, spans)]
+    summary = {
+        "items": len(sentences_data),
+        "chunks": sum(1 for r in records if r["record"] == "chunk"),
+        "extract_seconds": round(extract_seconds, 3),
+        "chunk_seconds": round(time.perf_counter() - start_time, 3),
+        "failed_pages": failed_pages
+    }
+    return records, summary
+
+
+# --- Service Side ---
+class ChunkService:
+    """ Worker pool plus admission control (bounded queue) and latency metrics. """
+    def __init__(self, n_workers=2, queue_size=8, tokenizer_name=DEFAULT_TOKENIZER, path_root=None, page_timeout=DEFAULT_PAGE_TIMEOUT):
+        self.n_workers = max(1, int(n_workers)); self.capacity = self.n_workers + max(0, int(queue_size))
+        self.tokenizer_name = tokenizer_name; self.page_timeout = float(page_timeout)
+        self.path_root = os.path.realpath(path_root) if path_root else None
+        self.lock = threading.Lock() # Admission counters and metrics
+        self.pool_lock = threading.Lock() # Serializes replacing a broken pool
+        self.admitted = 0 # Requests running or waiting for a worker
+        self.counters = {"completed": 0, "rejected": 0, "failed": 0}
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+        self.started_at = time.time()
+        self.pool = self._start_pool()
+
+    def _start_pool(self):
+        pool = ProcessPoolExecutor(max_workers=self.n_workers, initializer=_init_worker, initargs=(self.tokenizer_name, self.page_timeout))
+        warm = [pool.submit(_warm_worker, 0.2) for _ in range(self.n_workers)] # Start every worker now, not on first request
+        print(f"Chunk service workers ready: pids {sorted({f.result() for f in warm})}")
+        return pool
+
+    def try_admit(self):
+        with self.lock:
+            if self.admitted >= self.capacity: self.counters["rejected"] += 1; return False
+            self.admitted += 1; return True
+
+    def release(self, latency_ms=None, failed=False):
+        with self.lock:
+            self.admitted -= 1
+            if failed: self.counters["failed"] += 1
+            elif latency_ms is not None: self.counters["completed"] += 1; self.latencies_ms.append(latency_ms)
+
+    def resolve_path(self, path):
+        """Returns the real path if it lies inside path_root, else None."""
+        if not self.path_root or not path: return None
+        real = os.path.realpath(os.path.join(self.path_root, path))
+        if os.path.commonpath([real, self.path_root]) != self.path_root or not os.path.isfile(real): return None
+        return real
+
+    def run(self, file_name, file_content, path, heading_criteria, params):
+        """
+        Runs an admitted request. Its slot is released when the job itself finishes, not when the
+        caller stops waiting, so timed-out jobs still count against the queue capacity.
+        """
+        job_args = (file_name, file_content, path, heading_criteria, params, self.tokenizer_name == APPROXIMATE_TOKENIZER)
+        start_time = time.perf_counter()
+        def job_done(future):
+            failed = future.cancelled() or future.exception() is not None or future.result()[0] is None
+            self.release((time.perf_counter() - start_time) * 1000, failed=failed)
+        pool = self.pool
+        try:
+            try: future = pool.submit(_chunk_job, *job_args)
+            except Exception: self.release(failed=True); raise
+            future.add_done_callback(job_done)
+            try: return future.result(timeout=JOB_TIMEOUT)
+            except FutureTimeoutError: future.cancel(); raise # Frees the slot now if the job never started
+        except BrokenProcessPool: # A worker died (e.g. MuPDF crash): replace the pool for later requests
+            with self.pool_lock: # Not self.lock: admission and /health keep working while workers start
+                if self.pool is pool: # Requests that failed on the same pool replace it only once
+                    self.pool = self._start_pool()
+                    pool.shutdown(wait=False)
+            raise
+
+    def health(self):
+        with self.lock:
+            latencies = sorted(self.latencies_ms)
+            admitted = self.admitted; counters = dict(self.counters)
+        def percentile(q):
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 1) if latencies else None
+        return {
+            "status": "ok", "workers": self.n_workers, "tokenizer": self.tokenizer_name,
+            "in_flight": min(admitted, self.n_workers), "queue_depth": max(0, admitted - self.n_workers),
+            "queue_capacity": self.capacity - self.n_workers, **counters,
+            "latency_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99), "window": len(latencies)},
+            "uptime_seconds": round(time.time() - self.started_at, 1)
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class ChunkRequestHandler(BaseHTTPRequestHandler):
+    service = None # Set by serve()
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items(): self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health": self._send_json(200, self.service.health())
+        else: self._send_json(404, {"error": "Not found."})
+
+    def _parse_request(self):
+        """Output: (file_name, file_content, path, heading_criteria, params) or raises ValueError."""
+        query = {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        if length < 0: raise ValueError("Content-Length must not be negative.")
+        if length > MAX_UPLOAD_MB * 1024 * 1024: raise OverflowError(f"Upload larger than {MAX_UPLOAD_MB} MB.")
+        body = self.rfile.read(length) if length else b""
+
+        if self.headers.get("Content-Type", "").split(";")[0].strip() == "application/json":
+            options = json.loads(body or b"{}"); file_content = None
+            if not isinstance(options, dict): raise ValueError("The JSON body must be an object.")
+            path = self.service.resolve_path(options.get("path"))
+            if path is None: raise ValueError("'path' is missing, outside the allowed root, or path access is disabled.")
+            file_name = options.get("file_name") or os.path.basename(path)
+        else:
+            options = dict(query); path = None; file_content = body
+            if "heading_criteria" in options: options["heading_criteria"] = json.loads(options["heading_criteria"])
+            file_name = options.get("file_name")
+            if not file_content or not file_name: raise ValueError("Send the document as the body and its name as ?file_name=.")
+        if not isinstance(file_name, str): raise ValueError("'file_name' must be a string.")
+        if file_name.split('.')[-1].lower() not in ("pdf", "docx"): raise ValueError("Only .pdf and .docx files are supported.")
+
+        heading_criteria = {**DEFAULT_HEADING_CRITERIA, **(options.get("heading_criteria") or {})}
+        params = {"mode": options.get("mode", "token")}
+        if params["mode"] not in CHUNK_MODES: raise ValueError(f"mode must be one of {', '.join(CHUNK_MODES)}.")
+        for key, minimum in INT_PARAMS.items():
+            if options.get(key) is None: continue
+            params[key] = int(options[key])
+            if minimum is not None and params[key] < minimum: raise ValueError(f"{key} must be at least {minimum}.")
+        return file_name, file_content, path, heading_criteria, params
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/chunk": self._send_json(404, {"error": "Not found."}); return
+        try: request = self._parse_request()
+        except OverflowError as e: self._send_json(413, {"error": str(e)}); return
+        except (ValueError, TypeError) as e: self._send_json(400, {"error": str(e)}); return
+
+        if not self.service.try_admit(): # Backpressure: queue full
+            self._send_json(503, {"error": "Service saturated, retry later."}, {"Retry-After": "1"}); return
+        try: records, summary = self.service.run(*request) # The slot is released by the job, see ChunkService.run
+        except FutureTimeoutError: self._send_json(504, {"error": f"Processing exceeded {JOB_TIMEOUT}s."}); return
+        except BrokenProcessPool: self._send_json(500, {"error": "Worker crashed while processing this document."}); return
+        except Exception as e: self._send_json(500, {"error": f"{type(e).__name__}: {e}"}); return
+        if records is None: self._send_json(422, summary); return
+
+        # Stream NDJSON; the connection closes at the end (HTTP/1.0 style)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for record in records: self.wfile.write((json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+            self.wfile.write((json.dumps({"record": "summary", **summary}) + "\n").encode("utf-8"))
+        except (BrokenPipeError, ConnectionResetError): pass # Client went away
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} - {format % args}")
+
+
+def serve(host="127.0.0.1", port=8765, n_workers=2, queue_size=8, tokenizer_name=DEFAULT_TOKENIZER, path_root=None,
+          page_timeout=DEFAULT_PAGE_TIMEOUT):
+    service = ChunkService(n_workers, queue_size, tokenizer_name, path_root, page_timeout)
+    handler = type("BoundChunkRequestHandler", (ChunkRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    print(f"Chunk service listening on http://{host}:{port} ({service.n_workers} workers, queue {queue_size})")
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
+    finally:
+        server.server_close(); service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP chunking service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes (each holds a tokenizer and punkt)")
+    parser.add_argument("--queue-size", type=int, default=8, help="Requests allowed to wait for a worker before 503")
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER, help="tiktoken encoding, tokenizer.json path or 'approximate'")
+    parser.add_argument("--path-root", default=None, help="Allow JSON requests to name files inside this directory")
+    parser.add_argument("--page-timeout", type=float, default=DEFAULT_PAGE_TIMEOUT, help="Seconds per PDF page before its process is killed")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.queue_size, args.tokenizer, args.path_root, args.page_timeout)
+
+
+if __name__ == "__main__":
+    main()
+# --- END OF FILE chunk_service.py ---
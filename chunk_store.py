@@ -0,0 +1,178 @@
+# --- START OF FILE chunk_store.py ---
+"""
+Local SQLite chunk store with an FTS5 full-text index.
+Usage:
+    python chunk_store.py ingest chunks.db book.pdf_chunks_v15.csv [--source book.pdf]
+    python chunk_store.py search chunks.db "query terms" [--limit 20] [--source book.pdf]
+"""
+import os
+import re
+import argparse
+import sqlite3
+import pandas as pd
+
+INSERT_BATCH_SIZE = 5000 # Rows per transaction
+EXPORT_NAME_RE = re.compile(r"^(.+)_chunks(?:_v\d+)?(?: \(\d+\))?\.csv$") # app.py downloads '<upload name>_chunks_v15.csv'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    page_number TEXT,
+    title TEXT,
+    token_count INTEGER,
+    chunk_text TEXT NOT NULL,
+    PRIMARY KEY (source, chunk_id) -- Chunk ids like 'p3_c0' repeat across books
+);
+CREATE INDEX IF NOT EXISTS chunks_source ON chunks(source);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    chunk_text, title, content='chunks', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts(rowid, chunk_text, title) VALUES (new.rowid, new.chunk_text, new.title);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts(chunks_fts, rowid, chunk_text, title) VALUES ('delete', old.rowid, old.chunk_text, old.title);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_au AFTER UPDATE ON chunks BEGIN
+    INSERT INTO chunks_fts(chunks_fts, rowid, chunk_text, title) VALUES ('delete', old.rowid, old.chunk_text, old.title);
+    INSERT INTO chunks_fts(rowid, chunk_text, title) VALUES (new.rowid, new.chunk_text, new.title);
+END;
+"""
+
+UPSERT_SQL = """
+INSERT INTO chunks (chunk_id, source, page_number, title, token_count, chunk_text) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(source, chunk_id) DO UPDATE SET
+    page_number = excluded.page_number, title = excluded.title,
+    token_count = excluded.token_count, chunk_text = excluded.chunk_text
+WHERE chunks.chunk_text IS NOT excluded.chunk_text OR chunks.page_number IS NOT excluded.page_number
+   OR chunks.title IS NOT excluded.title OR chunks.token_count IS NOT excluded.token_count
+"""
+
+
+def _migrate_global_chunk_ids(conn):
+    """Stores created with 'chunk_id TEXT PRIMARY KEY' are copied into the (source, chunk_id) table."""
+    pk_columns = [row[1] for row in conn.execute("PRAGMA table_info(chunks)") if row[5]]
+    if pk_columns != ["chunk_id"]: return
+    with conn:
+        conn.execute("ALTER TABLE chunks RENAME TO chunks_old")
+        for name in ("chunks_ai", "chunks_ad", "chunks_au"): conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute("DROP INDEX IF EXISTS chunks_source")
+        conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('delete-all')")
+    conn.executescript(SCHEMA)
+    with conn:
+        conn.execute("""INSERT INTO chunks (chunk_id, source, page_number, title, token_count, chunk_text)
+                        SELECT chunk_id, COALESCE(source, ''), page_number, title, token_count, chunk_text FROM chunks_old""")
+        conn.execute("DROP TABLE chunks_old")
+
+
+def open_chunk_store(db_path):
+    """Opens (and creates if needed) the store in WAL mode."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL") # Safe with WAL, much faster bulk inserts
+    _migrate_global_chunk_ids(conn)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def insert_chunks(conn, chunks, source, tokenizer=None, batch_size=INSERT_BATCH_SIZE):
+    """
+    Stores one run of chunks for source: bulk upsert batched into transactions, then the rows of
+    source that are not in this run are deleted. Rows are keyed by (source, 'chunk_id' if present,
+    otherwise '#<index>'); unchanged rows are skipped.
+    token_count is taken from the chunk, else counted with tokenizer if given.
+    Output: Number of chunks in the run (upserts attempted, including unchanged rows the upsert skipped).
+    """
+    run_ids = set()
+    def rows():
+        for i, chunk in enumerate(chunks):
+            token_count = chunk.get("token_count")
+            if token_count is None and tokenizer is not None:
+                try: token_count = len(tokenizer.encode(chunk["chunk_text"]))
+                except Exception as e: print(f"Tokenize Error: {e}")
+            page_number = chunk.get("page_number")
+            chunk_id = str(chunk.get("chunk_id") or f"#{i}"); run_ids.add(chunk_id)
+            yield (chunk_id, source,
+                   None if page_number is None else str(page_number), chunk.get("title"),
+                   None if token_count is None else int(token_count), chunk["chunk_text"])
+
+    written = 0; batch = []
+    for row in rows():
+        batch.append(row)
+        if len(batch) >= batch_size:
+            with conn: conn.executemany(UPSERT_SQL, batch) # One transaction per batch
+            written += len(batch); batch = []
+    if batch:
+        with conn: conn.executemany(UPSERT_SQL, batch)
+        written += len(batch)
+    stale = [(source, chunk_id) for (chunk_id,) in conn.execute("SELECT chunk_id FROM chunks WHERE source = ?", (source,))
+             if chunk_id not in run_ids]
+    if stale:
+        with conn: conn.executemany("DELETE FROM chunks WHERE source = ? AND chunk_id = ?", stale)
+    return written
+
+
+def _quote_fts_terms(query):
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def search_chunks(conn, query, limit=20, source=None):
+    """
+    Full-text search, best matches first (bm25). Plain words work; FTS5 syntax (AND/OR/NEAR,
+    "phrases", prefix*) is used when valid and otherwise the terms are quoted.
+    Output: List of dictionaries [{'chunk_id', 'source', 'page_number', 'title', 'token_count', 'snippet', 'chunk_text'}]
+    """
+    if not query or not query.strip(): return []
+    sql = """
+        SELECT c.chunk_id, c.source, c.page_number, c.title, c.token_count,
+               snippet(chunks_fts, 0, '[', ']', '…', 12), c.chunk_text
+        FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid
+        WHERE chunks_fts MATCH ? {source_filter}
+        ORDER BY bm25(chunks_fts) LIMIT ?
+    """.format(source_filter="AND c.source = ?" if source else "")
+    for match_query in (query, _quote_fts_terms(query)):
+        params = [match_query] + ([source] if source else []) + [int(limit)]
+        try: rows = conn.execute(sql, params).fetchall(); break
+        except sqlite3.OperationalError: rows = [] # Invalid FTS5 syntax: retry with quoted terms
+    keys = ("chunk_id", "source", "page_number", "title", "token_count", "snippet", "chunk_text")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def source_from_export_name(csv_path):
+    """The source the app stored a book under, recovered from its CSV export name; None if the name doesn't match."""
+    match = EXPORT_NAME_RE.match(os.path.basename(csv_path))
+    return match.group(1) if match else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite FTS5 chunk store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_ingest = sub.add_parser("ingest", help="Load an exported chunk CSV")
+    p_ingest.add_argument("db"); p_ingest.add_argument("csv")
+    p_ingest.add_argument("--source", default=None, help="Source name (default: the book name of an app export, '<book>_chunks_v15.csv')")
+    p_search = sub.add_parser("search", help="Full-text search")
+    p_search.add_argument("db"); p_search.add_argument("query")
+    p_search.add_argument("--limit", type=int, default=20)
+    p_search.add_argument("--source", default=None)
+    args = parser.parse_args()
+
+    conn = open_chunk_store(args.db)
+    try:
+        if args.command == "ingest":
+            source = args.source or source_from_export_name(args.csv)
+            if not source: parser.error("--source is required unless the CSV is named like an app export ('<book>_chunks_v15.csv').")
+            df = pd.read_csv(args.csv)
+            df = df.astype(object).where(pd.notna(df), None)
+            written = insert_chunks(conn, df.to_dict("records"), source)
+            print(f"Stored {written} chunks for {source} in {args.db}")
+        else:
+            for r in search_chunks(conn, args.query, args.limit, args.source):
+                print(f"{r['source']} | p.{r['page_number']} | {r['title']} | {r['chunk_id']}\n    {r['snippet']}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
+# --- END OF FILE chunk_store.py ---
@@ -1,95 +1,272 @@
 # --- START OF FILE chunker.py ---
 import tiktoken
+import json
+import hashlib
+from array import array
+from bisect import bisect_left, bisect_right
 
-def chunk_structured_sentences(sentences_structure, tokenizer, target_tokens, overlap_sentences):
+UNKNOWN_CHAPTER = "Unknown Chapter / Front Matter"
+
+def split_token_windows(token_ids, tokenizer, target_tokens, overlap_tokens=0):
+    """
+    Splits one already-encoded item into windows of at most target_tokens ids.
+    Window edges are moved back to UTF-8 character starts so no slice decodes to
+    a broken character; the text is sliced from the token bytes, never re-encoded.
+    Input: List of token ids for one sentence/item.
+    Output: List of (window_text, window_token_count, char_start, char_end) tuples,
+            char offsets being relative to the decoded item text.
+    Raises ValueError if target_tokens < 1 (a window could never advance).
+    """
+    if target_tokens < 1: raise ValueError(f"target_tokens must be at least 1, got {target_tokens}.")
+    if not token_ids: return []
+    token_bytes = tokenizer.decode_tokens_bytes(token_ids)
+    full_bytes = b"".join(token_bytes)
+    byte_offsets = [0]
+    for tb in token_bytes: byte_offsets.append(byte_offsets[-1] + len(tb))
+    n_ids = len(token_ids)
+    # Token indices where a window may start/end (a byte that is not a UTF-8 continuation)
+    is_boundary = [off >= len(full_bytes) or (full_bytes[off] & 0xC0) != 0x80 for off in byte_offsets]
+    char_offsets = [0] # Characters decoded before each token index
+    for tb in token_bytes: char_offsets.append(char_offsets[-1] + sum(1 for byte in tb if (byte & 0xC0) != 0x80))
+    overlap_tokens = max(0, min(overlap_tokens, target_tokens - 1))
+
+    windows = []
+    start = 0
+    while start < n_ids:
+        end = min(start + target_tokens, n_ids)
+        while end > start + 1 and not is_boundary[end]: end -= 1 # Don't cut inside a character
+        raw_text = full_bytes[byte_offsets[start]:byte_offsets[end]].decode("utf-8", errors="replace")
+        window_text = raw_text.strip()
+        if window_text:
+            char_start = char_offsets[start] + len(raw_text) - len(raw_text.lstrip())
+            windows.append((window_text, end - start, char_start, char_start + len(window_text)))
+        if end >= n_ids: break
+        next_start = end - overlap_tokens
+        while next_start > start + 1 and not is_boundary[next_start]: next_start -= 1
+        start = next_start if next_start > start else end
+    return windows
+
+
+def token_overlap_start(prefix_tokens, base_pos, floor_pos, pos, min_tokens, cap_tokens=None):
+    """
+    Picks where the overlap before content position pos starts, by binary search over prefix sums.
+    prefix_tokens[k - base_pos] is the token total of positions base_pos..k-1.
+    Returns the latest start giving >= min_tokens of trailing context (floor_pos if there is not
+    enough), moved forward if needed so the overlap never exceeds cap_tokens.
+    """
+    pos_prefix = prefix_tokens[pos - base_pos]
+    start = bisect_right(prefix_tokens, pos_prefix - min_tokens, floor_pos - base_pos, pos - base_pos + 1) - 1 + base_pos
+    if start < floor_pos: start = floor_pos
+    if cap_tokens is not None and pos_prefix - prefix_tokens[start - base_pos] > cap_tokens:
+        start = bisect_left(prefix_tokens, pos_prefix - cap_tokens, start - base_pos, pos - base_pos + 1) + base_pos
+    return start
+
+
+def chunk_overlap_start(prefix_tokens, base_pos, floor_pos, pos, sentence_tokens, target_tokens, overlap_sentences,
+                        overlap_tokens=None, overlap_cap_tokens=None):
+    """
+    Where the next chunk starts when content position pos no longer fits: the last overlap_sentences
+    positions (or token_overlap_start if overlap_tokens is set), with leading overlap sentences
+    dropped until overlap + the sentence at pos fit target_tokens. Shared by every token chunker.
+    """
+    if overlap_tokens is None: start = max(floor_pos, pos - overlap_sentences)
+    else: start = token_overlap_start(prefix_tokens, base_pos, floor_pos, pos, overlap_tokens, overlap_cap_tokens)
+    budget = target_tokens - sentence_tokens
+    pos_prefix = prefix_tokens[pos - base_pos]
+    if pos_prefix - prefix_tokens[start - base_pos] > budget:
+        start = bisect_left(prefix_tokens, pos_prefix - budget, start - base_pos, pos - base_pos + 1) + base_pos
+    return start
+
+
+def plan_token_chunks(n_positions, encode_at, chapter_at, target_tokens, overlap_sentences,
+                      overlap_tokens=None, overlap_cap_tokens=None, start_pos=0):
+    """
+    The greedy token-chunking loop shared by chunk_structured_sentences, chunk_hierarchical and
+    document_model.chunk_document, over content positions 0..n_positions-1 (headings excluded).
+    encode_at(pos) returns the token ids of a position ([] on error), chapter_at(pos) its chapter.
+    A chunk never spans two chapters, overlap never reaches into an earlier chapter or past an
+    oversized item, and chunk_overlap_start keeps every chunk within target_tokens.
+    start_pos must be where a chunk of the full run starts; chunking resumes exactly as the full
+    run would, re-encoding earlier positions only as far back as the overlap can reach.
+    Yields ('chunk', first_pos, last_pos, token_count) and ('oversized', pos, token_ids).
+    Raises ValueError if target_tokens < 1.
+    """
+    if target_tokens < 1: raise ValueError(f"target_tokens must be at least 1, got {target_tokens}.")
+    if start_pos >= n_positions: return
+    current_chapter = chapter_at(start_pos)
+
+    # Resume: rebuild the overlap window and whether the chunk at start_pos began with overlap
+    lookback = []; last_oversized_pos = -1
+    k = start_pos
+    while k > 0 and chapter_at(k - 1) == current_chapter and sum(lookback) < target_tokens:
+        count = len(encode_at(k - 1))
+        if count >= target_tokens: last_oversized_pos = k - 1; break
+        k -= 1; lookback.insert(0, count)
+    chapter_first_pos = k # Overlap is trimmed below target_tokens, so it never needs to reach further back
+    resume_with_overlap = any(lookback) # Previous chunk ended on ordinary content of this chapter
+    prefix_base = k
+    prefix_tokens = array("q", [0]) # prefix_tokens[p - prefix_base]: token total of positions prefix_base..p-1
+    for count in lookback: prefix_tokens.append(prefix_tokens[-1] + count)
+
+    first_pos = -1; last_pos = -1; chunk_tokens = 0
+    for pos in range(start_pos, n_positions):
+        chapter = chapter_at(pos)
+        if chapter != current_chapter:
+            if first_pos >= 0: yield ("chunk", first_pos, last_pos, chunk_tokens)
+            first_pos = -1; chunk_tokens = 0
+            current_chapter = chapter; chapter_first_pos = pos
+
+        token_ids = encode_at(pos)
+        sentence_tokens = len(token_ids)
+        prefix_tokens.append(prefix_tokens[-1] + sentence_tokens)
+        if not sentence_tokens: continue
+
+        # --- Oversized Item: token windows become their own chunks ---
+        if sentence_tokens >= target_tokens:
+            if first_pos >= 0: yield ("chunk", first_pos, last_pos, chunk_tokens)
+            first_pos = -1; chunk_tokens = 0
+            yield ("oversized", pos, token_ids)
+            last_oversized_pos = pos
+            continue
+
+        if (first_pos >= 0 and chunk_tokens + sentence_tokens > target_tokens) or (pos == start_pos and resume_with_overlap):
+            if first_pos >= 0: yield ("chunk", first_pos, last_pos, chunk_tokens)
+            overlap_floor = max(chapter_first_pos, last_oversized_pos + 1)
+            first_pos = chunk_overlap_start(prefix_tokens, prefix_base, overlap_floor, pos, sentence_tokens, target_tokens,
+                                            overlap_sentences, overlap_tokens, overlap_cap_tokens)
+            chunk_tokens = prefix_tokens[pos - prefix_base] - prefix_tokens[first_pos - prefix_base]
+        if first_pos < 0: first_pos = pos
+        last_pos = pos
+        chunk_tokens += sentence_tokens
+
+    if first_pos >= 0: yield ("chunk", first_pos, last_pos, chunk_tokens)
+
+
+def chunk_structured_sentences(sentences_structure, tokenizer, target_tokens, overlap_sentences, oversize_overlap_tokens=0,
+                               start_item=0, with_item_spans=False, overlap_tokens=None, overlap_cap_tokens=None):
     """
     Chunks sentences/headings based on tokens, assigns last known chapter title.
+    Items at or above target_tokens are split into token windows (see split_token_windows).
+    If overlap_tokens is set, overlap is the fewest trailing sentences giving at least that many
+    tokens (overlap_sentences is ignored); overlap_cap_tokens bounds it further. In both modes the
+    overlap is trimmed so no chunk exceeds target_tokens (see chunk_overlap_start).
+    start_item resumes chunking at that item index, which must start a chunk of the full run;
+    with_item_spans adds 'item_start'/'item_end' (indices into the input list) to each chunk.
     Input: List of (text, page_num_marker, detected_chapter_title) tuples.
-    Output: List of dictionaries [{'chunk_text': ..., 'page_number': ..., 'title': ...}]
+    Output: List of dictionaries [{'chunk_text': ..., 'page_number': ..., 'title': ..., 'token_count': ...}]
     """
     if not tokenizer: print("ERROR: Tokenizer not provided."); return []
     if not sentences_structure: print("Warning: No sentences provided."); return []
 
+    # Content items (where detected_chapter_title is None) and the chapter in effect for each
+    content_indices = []; content_chapters = []
+    current_chapter = UNKNOWN_CHAPTER # Initial state
+    for i, (_, _, ch) in enumerate(sentences_structure):
+        if ch is not None: current_chapter = ch
+        else: content_indices.append(i); content_chapters.append(current_chapter)
+
+    def encode_at(pos):
+        try: return tokenizer.encode(sentences_structure[content_indices[pos]][0])
+        except Exception as e: print(f"Tokenize Error: {e}"); return []
+
     chunks_data = []
-    current_chunk_texts = []
-    current_chunk_pages = [] # Still track page/para markers
-    current_chunk_tokens = 0
-    current_chapter = "Unknown Chapter / Front Matter" # Initial state
-
-    # Indices of content items (where detected_chapter_title is None)
-    content_indices = [i for i, (_, _, ch) in enumerate(sentences_structure) if ch is None]
-
-    def finalize_chunk():
-        nonlocal chunks_data, current_chunk_texts, current_chunk_pages, current_chunk_tokens, current_chapter
-        if current_chunk_texts:
-            chunk_text_joined = " ".join(current_chunk_texts).strip()
-            start_marker = current_chunk_pages[0] if current_chunk_pages else "N/A"
-            if chunk_text_joined:
-                chunks_data.append({
-                    "chunk_text": chunk_text_joined,
-                    "page_number": start_marker, # Keep page/para marker
-                    "title": current_chapter # Use 'title' as the key
-                })
-            current_chunk_texts, current_chunk_pages, current_chunk_tokens = [], [], 0
-
-    current_content_item_index = 0
-
-    while current_content_item_index < len(content_indices):
-        original_list_index = content_indices[current_content_item_index]
-
-        # Find most recent chapter heading before this item
-        temp_chapter = current_chapter
-        for j in range(original_list_index, -1, -1): # Iterate backwards from current item
-            _, _, ch_title_lookup = sentences_structure[j] # Unpack 3 items
-            if ch_title_lookup is not None:
-                temp_chapter = ch_title_lookup
-                break # Stop searching back
-
-        # If the chapter context changed *before* this content item started
-        if temp_chapter != current_chapter:
-            finalize_chunk() # Finalize the chunk belonging to the old chapter
-            current_chapter = temp_chapter # Update to the new chapter
-
-        # Process the content item
-        text, page_marker, _ = sentences_structure[original_list_index] # Unpack 3 items
-        try: sentence_tokens = len(tokenizer.encode(text))
-        except Exception as e: print(f"Tokenize Error: {e}"); current_content_item_index += 1; continue
-
-        # Check chunk boundary condition
-        # Finalize if chunk has text AND (adding sentence exceeds target OR sentence itself is huge)
-        if current_chunk_texts and \
-           ((current_chunk_tokens + sentence_tokens > target_tokens and sentence_tokens < target_tokens) or sentence_tokens >= target_tokens):
-             finalize_chunk()
-
-             # --- Overlap Logic ---
-             overlap_start_content_idx = max(0, current_content_item_index - overlap_sentences)
-             for k in range(overlap_start_content_idx, current_content_item_index):
-                 overlap_original_idx = content_indices[k]
-                 if overlap_original_idx < len(sentences_structure):
-                     o_text, o_marker, _ = sentences_structure[overlap_original_idx] # Unpack 3
-                     try:
-                         o_tokens = len(tokenizer.encode(o_text))
-                         current_chunk_texts.append(o_text)
-                         current_chunk_pages.append(o_marker)
-                         current_chunk_tokens += o_tokens
-                     except Exception as e: print(f"Error encoding overlap: {e}")
-                 else: print(f"Warn: Overlap index {overlap_original_idx} OOB.")
-             # --- End Overlap Logic ---
-
-        # Add current text if not exactly duplicated by overlap ending
-        if not current_chunk_texts or text != current_chunk_texts[-1]:
-            current_chunk_texts.append(text)
-            current_chunk_pages.append(page_marker)
-            current_chunk_tokens += sentence_tokens
-        elif not current_chunk_pages or page_marker != current_chunk_pages[-1]:
-             current_chunk_pages.append(page_marker) # Still add page marker if text was duplicate
-
-        current_content_item_index += 1
-
-    finalize_chunk() # Add last chunk
+    plan = plan_token_chunks(len(content_indices), encode_at, content_chapters.__getitem__, target_tokens, overlap_sentences,
+                             overlap_tokens, overlap_cap_tokens, start_pos=bisect_left(content_indices, start_item))
+    for kind, pos, last_or_ids, *token_count in plan:
+        first_item = content_indices[pos]
+        text, page_marker, _ = sentences_structure[first_item]
+        if kind == "chunk":
+            last_item = content_indices[last_or_ids]
+            chunks_data.append({
+                "chunk_text": " ".join(sentences_structure[content_indices[k]][0] for k in range(pos, last_or_ids + 1)),
+                "page_number": page_marker, # Page/para marker of the first sentence
+                "title": content_chapters[pos],
+                "token_count": token_count[0]
+            })
+            if with_item_spans: chunks_data[-1].update(item_start=first_item, item_end=last_item)
+            continue
+        try: windows = split_token_windows(last_or_ids, tokenizer, target_tokens, oversize_overlap_tokens)
+        except Exception as e: print(f"Token split Error: {e}"); windows = [(text, len(last_or_ids), 0, len(text))]
+        for window_text, window_tokens, _, _ in windows:
+            chunks_data.append({"chunk_text": window_text, "page_number": page_marker, "title": content_chapters[pos], "token_count": window_tokens})
+            if with_item_spans: chunks_data[-1].update(item_start=first_item, item_end=first_item)
     return chunks_data
 
 
+# --- Incremental Re-chunking ---
+def item_fingerprint(item):
+    """Short stable hash of one (text, page_num_marker, detected_chapter_title) item."""
+    text, page_marker, title = item
+    return hashlib.sha1(f"{text}\x1f{page_marker}\x1f{title}".encode("utf-8")).hexdigest()[:16]
+
+
+def _chunk_id(chunk, seen_ids):
+    base = hashlib.sha1(f"{chunk['title']}\x1f{chunk['page_number']}\x1f{chunk['chunk_text']}".encode("utf-8")).hexdigest()[:16]
+    chunk_id = base; n = 1
+    while chunk_id in seen_ids: chunk_id = f"{base}-{n}"; n += 1 # Identical chunks in one document
+    seen_ids.add(chunk_id)
+    return chunk_id
+
+
+def load_chunk_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f: return json.load(f)
+    except (OSError, ValueError): return None
+
+
+def save_chunk_manifest(path, manifest):
+    with open(path, "w", encoding="utf-8") as f: json.dump(manifest, f, ensure_ascii=False)
+
+
+def chunk_incremental(sentences_structure, tokenizer, target_tokens, overlap_sentences, previous_manifest=None, oversize_overlap_tokens=0,
+                      overlap_tokens=None, overlap_cap_tokens=None):
+    """
+    Token chunking that reuses the previous run of the same document.
+    Chunks whose items (and the item that closed them) come before the first changed item are
+    kept as-is with their chunk_id; chunking resumes after the last kept chunk, giving the same
+    chunks as a full run.
+    New chunk ids are content hashes, so unchanged chunks after the edit also keep their id.
+    Output: (chunks, manifest, stats) - store the manifest and pass it back on the next run.
+    """
+    params = {"target_tokens": target_tokens, "overlap_sentences": overlap_sentences,
+              "oversize_overlap_tokens": oversize_overlap_tokens, "overlap_tokens": overlap_tokens,
+              "overlap_cap_tokens": overlap_cap_tokens, "tokenizer": getattr(tokenizer, "name", None)}
+    for coef in ("chars_coef", "words_coef"): # Approximate counting: chunks sized with other coefficients can't be kept
+        if hasattr(tokenizer, coef): params[coef] = getattr(tokenizer, coef)
+    fingerprints = [item_fingerprint(item) for item in sentences_structure]
+    previous_ok = previous_manifest and previous_manifest.get("params") == params
+    prev_fingerprints = previous_manifest.get("item_fingerprints", []) if previous_ok else []
+    prev_chunks = previous_manifest.get("chunks", []) if previous_ok else []
+
+    first_changed = 0
+    while first_changed < min(len(fingerprints), len(prev_fingerprints)) and fingerprints[first_changed] == prev_fingerprints[first_changed]:
+        first_changed += 1
+
+    if previous_ok and first_changed == len(fingerprints) == len(prev_fingerprints): # Nothing changed
+        kept_chunks, new_chunks, resume_item = list(prev_chunks), [], len(sentences_structure)
+    else:
+        kept_chunks = []
+        for chunk in prev_chunks:
+            next_item = chunk["item_end"] + 1 # The content item that closed this chunk must be unchanged too
+            while next_item < len(sentences_structure) and sentences_structure[next_item][2] is not None: next_item += 1
+            if next_item >= first_changed: break
+            kept_chunks.append(chunk)
+        # Resume at the first new item after the kept chunks (not at the old chunk's overlap);
+        # the planner rebuilds the overlap from the items before it, as in a full run
+        resume_item = kept_chunks[-1]["item_end"] + 1 if kept_chunks else 0
+        new_chunks = chunk_structured_sentences(
+            sentences_structure, tokenizer, target_tokens, overlap_sentences, oversize_overlap_tokens,
+            start_item=resume_item, with_item_spans=True, overlap_tokens=overlap_tokens, overlap_cap_tokens=overlap_cap_tokens
+        )
+
+    seen_ids = {c["chunk_id"] for c in kept_chunks}
+    for chunk in new_chunks: chunk["chunk_id"] = _chunk_id(chunk, seen_ids)
+    chunks = kept_chunks + new_chunks
+    manifest = {"params": params, "item_fingerprints": fingerprints, "chunks": chunks}
+    stats = {"reused_chunks": len(kept_chunks), "new_chunks": len(new_chunks), "resume_item": resume_item}
+    return chunks, manifest, stats
+
+
 def chunk_by_chapter(sentences_structure):
     """
     Groups all text under the most recently detected chapter title.
@@ -99,7 +276,7 @@ def chunk_by_chapter(sentences_structure):
     if not sentences_structure: return []
 
     chunks_by_chapter = {}
-    current_chapter = "Unknown Chapter / Front Matter" # Default for text before first heading
+    current_chapter = UNKNOWN_CHAPTER # Default for text before first heading
 
     for text, _, detected_title in sentences_structure: # Unpack 3 items
         if detected_title is not None:
@@ -123,4 +300,89 @@ def chunk_by_chapter(sentences_structure):
             })
 
     return output_list
+
+
+def parent_text(text_buffer, parent):
+    """Returns the text of a parent record (slice of the shared buffer)."""
+    return text_buffer[parent["start_char"]:parent["end_char"]]
+
+
+def chunk_hierarchical(sentences_structure, tokenizer, target_tokens, overlap_sentences, oversize_overlap_tokens=0,
+                       overlap_tokens=None, overlap_cap_tokens=None):
+    """
+    Builds chapter parents and token-sized children in a single pass over the items.
+    Parents are (start_char, end_char) spans into one shared text buffer; children carry
+    their text, their span in the same buffer and the parent_id they belong to.
+    Input: List of (text, page_num_marker, detected_chapter_title) tuples.
+    Output: Dictionary {'text_buffer': str, 'parents': [...], 'children': [...]}
+    """
+    if not tokenizer: print("ERROR: Tokenizer not provided."); return None
+    if not sentences_structure: print("Warning: No sentences provided."); return None
+
+    buffer_parts = []
+    buffer_len = 0
+    parents = []
+    children = []
+    current_chapter = UNKNOWN_CHAPTER # Default for text before first heading
+    pending = [] # (text, page_marker, token_ids) of the open parent
+
+    def finalize_parent():
+        nonlocal buffer_len, pending
+        if not pending: return
+        if buffer_parts:
+            buffer_parts.append("\n\n"); buffer_len += 2 # Parent separator
+        parent_id = f"p{len(parents)}"
+        parent_start = buffer_len
+        parent_str = " ".join(p_text for p_text, _, _ in pending)
+        buffer_parts.append(parent_str); buffer_len += len(parent_str)
+        parents.append({
+            "parent_id": parent_id,
+            "title": current_chapter,
+            "page_number": pending[0][1],
+            "start_char": parent_start,
+            "end_char": buffer_len
+        })
+
+        # Sentence spans relative to parent_str
+        spans = []; pos = 0
+        for p_text, _, _ in pending:
+            spans.append((pos, pos + len(p_text))); pos += len(p_text) + 1
+
+        def add_child(start, end, marker, tokens, text=None):
+            children.append({
+                "chunk_id": f"{parent_id}_c{len(children)}",
+                "parent_id": parent_id,
+                "chunk_text": text if text is not None else parent_str[start:end],
+                "page_number": marker,
+                "title": current_chapter,
+                "start_char": parent_start + start,
+                "end_char": parent_start + end,
+                "token_count": tokens
+            })
+
+        # Children: the same token chunking loop as chunk_structured_sentences, within this parent
+        plan = plan_token_chunks(len(pending), lambda idx: pending[idx][2], lambda idx: 0, target_tokens, overlap_sentences,
+                                 overlap_tokens, overlap_cap_tokens)
+        for kind, idx, last_or_ids, *token_count in plan:
+            if kind == "chunk":
+                add_child(spans[idx][0], spans[last_or_ids][1], pending[idx][1], token_count[0]); continue
+            s_start, s_end = spans[idx]
+            try: windows = split_token_windows(last_or_ids, tokenizer, target_tokens, oversize_overlap_tokens)
+            except Exception as e: print(f"Token split Error: {e}"); windows = [(parent_str[s_start:s_end], len(last_or_ids), 0, s_end - s_start)]
+            for w_text, w_tokens, w_start, w_end in windows:
+                add_child(s_start + w_start, s_start + w_end, pending[idx][1], w_tokens, w_text)
+        pending = []
+
+    heading_title = current_chapter # Latest heading; the parent switches when content under a new title arrives
+    for text, page_marker, detected_title in sentences_structure:
+        if detected_title is not None: heading_title = detected_title; continue
+        if heading_title != current_chapter: # Same rule as the flat chunkers: repeated or empty headings don't split
+            finalize_parent() # Close the previous chapter before switching title
+            current_chapter = heading_title
+        try: token_ids = tokenizer.encode(text)
+        except Exception as e: print(f"Tokenize Error: {e}"); continue
+        pending.append((text, page_marker, token_ids))
+    finalize_parent()
+
+    return {"text_buffer": "".join(buffer_parts), "parents": parents, "children": children}
 # --- END OF FILE chunker.py ---
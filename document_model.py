@@ -0,0 +1,142 @@
+# --- START OF FILE document_model.py ---
+import sys
+from array import array
+
+from chunker import split_token_windows, plan_token_chunks, UNKNOWN_CHAPTER
+
+
+class DocumentText:
+    """
+    Compact form of the extracted (text, page_num_marker, detected_chapter_title) items.
+    Content sentences live in one text buffer joined by single spaces; per-item offsets,
+    page-marker ids and chapter ids are kept in arrays. Heading items take no buffer space.
+    """
+    __slots__ = ("text", "starts", "ends", "is_heading", "marker_ids", "chapter_ids", "markers", "titles")
+
+    def __init__(self):
+        self.text = ""
+        self.starts = array("q"); self.ends = array("q") # Char offsets into text
+        self.is_heading = array("b")
+        self.marker_ids = array("l") # Index into markers
+        self.chapter_ids = array("l") # Index into titles: chapter in effect for the item (heading: its own title)
+        self.markers = []
+        self.titles = [UNKNOWN_CHAPTER]
+
+    @classmethod
+    def from_items(cls, items):
+        """Builds the model from any iterable of 3-tuples (a list or a streaming generator)."""
+        doc = cls()
+        parts = []; length = 0
+        marker_index = {}; title_index = {UNKNOWN_CHAPTER: 0}
+        current_chapter_id = 0
+        for text, page_marker, detected_title in items:
+            marker_id = marker_index.get(page_marker)
+            if marker_id is None:
+                marker_id = marker_index[page_marker] = len(doc.markers); doc.markers.append(page_marker)
+            if detected_title is not None:
+                current_chapter_id = title_index.get(detected_title)
+                if current_chapter_id is None:
+                    current_chapter_id = title_index[detected_title] = len(doc.titles); doc.titles.append(sys.intern(detected_title))
+                doc.starts.append(length); doc.ends.append(length); doc.is_heading.append(1)
+            else:
+                if parts: parts.append(" "); length += 1
+                parts.append(text)
+                doc.starts.append(length); length += len(text); doc.ends.append(length); doc.is_heading.append(0)
+            doc.marker_ids.append(marker_id); doc.chapter_ids.append(current_chapter_id)
+        doc.text = "".join(parts)
+        return doc
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        return self.item(i)
+
+    def item(self, i):
+        """Returns item i as the original (text, page_num_marker, detected_chapter_title) tuple."""
+        if self.is_heading[i]:
+            title = self.titles[self.chapter_ids[i]]
+            return (title, self.markers[self.marker_ids[i]], title)
+        return (self.text[self.starts[i]:self.ends[i]], self.markers[self.marker_ids[i]], None)
+
+    def __iter__(self):
+        for i in range(len(self)): yield self.item(i)
+
+    def nbytes(self):
+        """Approximate memory held by the model (buffer + arrays + tables)."""
+        arrays = (self.starts, self.ends, self.is_heading, self.marker_ids, self.chapter_ids)
+        return sys.getsizeof(self.text) + sum(a.buffer_info()[1] * a.itemsize for a in arrays) + \
+            sum(sys.getsizeof(m) for m in self.markers) + sum(sys.getsizeof(t) for t in self.titles)
+
+
+class ChunkSpan:
+    """ A chunk as a (start, end) span over DocumentText.text; turned into a string only on export. """
+    __slots__ = ("start", "end", "marker_id", "chapter_id", "token_count")
+
+    def __init__(self, start, end, marker_id, chapter_id, token_count):
+        self.start = start; self.end = end
+        self.marker_id = marker_id; self.chapter_id = chapter_id
+        self.token_count = token_count
+
+
+def chunk_document(doc, tokenizer, target_tokens, overlap_sentences, oversize_overlap_tokens=0,
+                   overlap_tokens=None, overlap_cap_tokens=None):
+    """
+    Token chunking over a DocumentText, producing ChunkSpans instead of joined strings.
+    Runs the same loop as chunker.chunk_structured_sentences (chunker.plan_token_chunks), so the
+    spans give exactly the same chunks; overlap is just an earlier span start, nothing is copied.
+    Output: List of ChunkSpan
+    """
+    if not tokenizer: print("ERROR: Tokenizer not provided."); return []
+    if not len(doc): print("Warning: No sentences provided."); return []
+
+    content = array("q", (i for i in range(len(doc)) if not doc.is_heading[i]))
+
+    def encode_at(pos):
+        item_idx = content[pos]
+        try: return tokenizer.encode(doc.text[doc.starts[item_idx]:doc.ends[item_idx]])
+        except Exception as e: print(f"Tokenize Error: {e}"); return []
+
+    spans = []
+    plan = plan_token_chunks(len(content), encode_at, lambda pos: doc.chapter_ids[content[pos]], target_tokens, overlap_sentences,
+                             overlap_tokens, overlap_cap_tokens)
+    for kind, pos, last_or_ids, *token_count in plan:
+        item_idx = content[pos]
+        if kind == "chunk":
+            spans.append(ChunkSpan(doc.starts[item_idx], doc.ends[content[last_or_ids]],
+                                   doc.marker_ids[item_idx], doc.chapter_ids[item_idx], token_count[0]))
+            continue
+        start, end = doc.starts[item_idx], doc.ends[item_idx]
+        try: windows = split_token_windows(last_or_ids, tokenizer, target_tokens, oversize_overlap_tokens)
+        except Exception as e: print(f"Token split Error: {e}"); windows = [(None, len(last_or_ids), 0, end - start)]
+        for _, w_tokens, w_start, w_end in windows:
+            spans.append(ChunkSpan(start + w_start, start + w_end, doc.marker_ids[item_idx], doc.chapter_ids[item_idx], w_tokens))
+    return spans
+
+
+def iter_span_records(doc, spans):
+    """Yields export dictionaries {'chunk_text', 'page_number', 'title', 'token_count'} one span at a time."""
+    for span in spans:
+        yield {
+            "chunk_text": doc.text[span.start:span.end],
+            "page_number": doc.markers[span.marker_id],
+            "title": doc.titles[span.chapter_id],
+            "token_count": span.token_count
+        }
+
+
+class SpanRecords:
+    """ Read-only sequence of export dictionaries over (doc, spans); each record is built when accessed. """
+    def __init__(self, doc, spans):
+        self.doc = doc; self.spans = spans
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice): return list(iter_span_records(self.doc, self.spans[i]))
+        return next(iter_span_records(self.doc, [self.spans[i]]))
+
+    def __iter__(self):
+        return iter_span_records(self.doc, self.spans)
+# --- END OF FILE document_model.py ---
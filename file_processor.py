@@ -3,6 +3,9 @@ import fitz
 import re
 import nltk
 import io
+import os
+import json
+import hashlib
 import docx
 from docx.enum.text import WD_ALIGN_PARAGRAPH # Import alignment enum
 import streamlit as st
@@ -38,96 +41,31 @@ def is_likely_metadata_or_footer(line):
         if len(line.split()) > 1 and not line.istitle() : return True
     return False
 
-# --- HEADING CHECKER v16 ---
-def check_heading_user_defined(
-    line_dict, line_text, page_width, is_single_line_block,
-    is_bold_hint, is_italic_hint, is_centered_hint, # Pass centering hint now
-    heading_criteria ):
-    """ Checks if a line matches user-defined heading criteria. """
-    words = line_text.split(); num_words = len(words)
-    if not line_text or num_words == 0: return None
-    if is_likely_metadata_or_footer(line_text): return None
-
-    # --- Apply User Selected Criteria ---
-    # Length
-    if heading_criteria['use_length']:
-        if not (heading_criteria['min_words'] <= num_words <= heading_criteria['max_words']): return None
-    # Keyword
-    if heading_criteria['keyword_pattern']:
-        try:
-            if not re.search(heading_criteria['keyword_pattern'], line_text, re.IGNORECASE): return None
-        except re.error: return None
-    # Isolation (PDF only)
-    if heading_criteria['require_isolated'] and line_dict is not None and not is_single_line_block: return None
-    # Centering (Use hint provided by caller)
-    if heading_criteria['require_centered'] and not is_centered_hint: return None
-
-    # --- Style & Case Checks ---
-    line_is_italic = is_italic_hint; line_is_bold = is_bold_hint
-    if line_dict: # If PDF, refine style checks using spans
-        try:
-            valid_spans = [s for s in line_dict["spans"] if s['text'].strip()]
-            if valid_spans:
-                total_chars=sum(len(s['text'].strip()) for s in valid_spans); italic_chars=0; bold_chars=0
-                for s in valid_spans:
-                    flags=s.get('flags',0); font_name=s.get('font','').lower(); span_len=len(s['text'].strip())
-                    if flags & 1 or "italic" in font_name: italic_chars += span_len
-                    if flags & 4 or "bold" in font_name or "black" in font_name: bold_chars += span_len
-                if total_chars > 0: line_is_italic=(italic_chars/total_chars)>0.6; line_is_bold=(bold_chars/total_chars)>0.6
-        except Exception: pass
-    if heading_criteria['require_italic'] and not line_is_italic: return None
-    if heading_criteria['require_bold'] and not line_is_bold: return None
-
-    is_line_title_case = line_text.istitle(); is_line_all_caps = line_text.isupper() and re.search("[A-Z]", line_text)
-    if heading_criteria['require_title_case'] and not is_line_title_case: return None
-    if heading_criteria['require_all_caps'] and not is_line_all_caps: return None
-    if heading_criteria['require_title_case'] and heading_criteria['require_all_caps']:
-        if not (is_line_title_case and is_line_all_caps):
-             if num_words > 1: return None
-
-    # If all required checks passed:
-    # print(f"✅ Matched Heading: {line_text}") # Debug
-    return line_text # Return the heading text
-
 
-# --- Main Extraction Function ---
-def extract_sentences_with_structure(
-    file_name, file_content, heading_criteria,
-    start_skip=0, end_skip=0, start_page_offset=1 ):
-    """ Extracts text, handles PDF/DOCX, detects headings based on criteria. """
-    _ALIGN_PARAGRAPH # Import alignment constants
-import streamlit as st
-
-# --- NLTK Download Logic ---
-# (Keep as is)
-def download_nltk_data(resource_name, resource_path):
-    try: nltk.data.find(resource_path)
-    except LookupError:
-        st.info(f"Downloading NLTK data package: '{resource_name}'...")
-        try: nltk.download(resource_name, quiet=True); st.success(f"NLTK data '{resource_name}' downloaded."); return True
-        except Exception as e: st.error(f"Download Error: Failed for NLTK '{resource_name}'. Error: {e}"); return False
-    except Exception as e_find: st.error(f"NLTK Find Error ({resource_name}): {e_find}"); return False
-    return True
-
-# --- Metadata/Footer Check ---
-# (Keep as is)
-def is_likely_metadata_or_footer(line):
-    line = line.strip();
-    if not line: return True
-    cleaned_line = re.sub(r"^\W+|\W+$", "", line)
-    if cleaned_line.isdigit() and line == cleaned_line and len(cleaned_line) < 4 : return True
-    if "www." in line or ".com" in line or "@" in line or "books" in line.lower() or "global" in line.lower() or ("center" in line.lower() and "peace" in line.lower()):
-        if len(line.split()) < 12: return True
-    if re.match(r"^\s*Page\s+\d+\s*$", line, re.IGNORECASE): return True
-    if "©" in line or "copyright" in line.lower() or "first published" in line.lower() or "isbn" in line.lower(): return True
-    if "printed in" in line.lower(): return True
-    if any(loc in line.lower() for loc in ["nizamuddin", "new delhi", "noida", "bensalem", "byberry road"]): return True
-    if len(set(line.strip())) < 4 and len(line.strip()) > 4: return True
-    if line.endswith(cleaned_line) and cleaned_line.isdigit() and len(line) < 80 and len(line) > len(cleaned_line) + 2:
-         if not re.search(r"[a-zA-Z]{4,}", line): return True
-    if len(line) < 15 and line.isupper() and not re.match(r"^\s*(CHAPTER|SECTION|PART)\s", line, re.IGNORECASE):
-        if len(line.split()) > 1 and not line.istitle() : return True
-    return False
+# --- PDF Line Style ---
+def pdf_line_style(line_dict, page_width):
+    """
+    Layout/style of a PDF line as heading detection judges it: roughly centered on the page,
+    and bold/italic when more than 60% of its non-blank characters are.
+    Output: (is_centered, is_bold, is_italic)
+    """
+    is_centered = False
+    bbox = line_dict.get('bbox', None)
+    if bbox and page_width > 0:
+        left = bbox[0]; right = bbox[2]
+        is_centered = abs(left - (page_width - right)) < (page_width * 0.20) and left > (page_width * 0.15)
+    is_bold = False; is_italic = False
+    try:
+        valid_spans = [s for s in line_dict["spans"] if s['text'].strip()]
+        total_chars = sum(len(s['text'].strip()) for s in valid_spans)
+        italic_chars = 0; bold_chars = 0
+        for s in valid_spans:
+            flags = s.get('flags', 0); font_name = s.get('font','').lower(); span_len = len(s['text'].strip())
+            if flags & 1 or "italic" in font_name: italic_chars += span_len
+            if flags & 4 or "bold" in font_name or "black" in font_name: bold_chars += span_len
+        if total_chars > 0: is_italic = (italic_chars / total_chars) > 0.6; is_bold = (bold_chars / total_chars) > 0.6
+    except Exception: pass
+    return is_centered, is_bold, is_italic
 
 
 # --- Heading Checker (Handles PDF dict or DOCX para info) ---
@@ -158,104 +96,8 @@ def check_heading_user_defined(
     # --- Apply PDF Specific Checks (if line_dict is provided) ---
     if line_dict:
         if heading_criteria['require_isolated'] and not is_single_line_block: return None
-        if heading_criteria['require_centered']:
-            is_centered = False
-            bbox = line_dict.get('bbox', None)
-            if bbox and page_width > 0:
-                left = bbox[0]; right = bbox[2]
-                if abs(left - (page_width - right)) < (page_width * 0.20) and left > (page_width * 0.15): is_centered = True
-            if not is_centered: return None # Fail if required but not met
-
-        # Extract PDF style info
-        line_is_italic_pdf = False; line_is_bold_pdf = False
-        try:
-            valid_spans = [s for s in line_dict["spans"] if s['text'].strip()]
-            if valid_spans:
-                total_chars = sum(len(s['text'].strip()) for s in valid_spans)
-                italic_chars = 0; bold_chars = 0
-                for s in valid_spans:
-                    flags = s.get('flags', 0); font_name = s.get('font','').lower(); span_len = len(s['text'].strip())
-                    if flags & 1 or "italic" in font_name: italic_chars += span_len
-                    if flags & 4 or "bold" in font_name or "black" in font_name: bold_chars += span_len
-                if total_chars > 0: line_is_italic_extracted_data = []; current_chapter_title_state = None; doc = None
-    file_extension = file_name.split('.')[-1].lower()
-
-    if file_extension == 'pdf':
-        try:
-            doc = fitz.open(stream=file_content, filetype="pdf"); total_pages = len(doc)
-            for page_num_0based, page in enumerate(doc):
-                if page_num_0based < start_skip: continue
-                if page_num_0based >= total_pages - end_skip: break
-                adjusted_page_num = page_num_0based - start_skip + start_page_offset
-                page_marker = adjusted_page_num; page_width = page.rect.width
-                try:
-                    blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT | fitz.TEXT_PRESERVE_LIGATURES)["blocks"]
-                    for b in blocks:
-                        if b['type'] == 0:
-                            is_single_line_block = len(b['lines']) == 1
-                            for l in b["lines"]:
-                                line_dict = l; line_text = "".join(s["text"] for s in l["spans"]).strip()
-                                if not line_text or is_likely_metadata_or_footer(line_text): continue
-
-                                # Centering hint for PDF
-                                is_centered_hint = False
-                                bbox = l.get('bbox');
-                                if bbox and page_width > 0:
-                                    left=bbox[0]; right=bbox[2]
-                                    if abs(left - (page_width - right)) < (page_width * 0.20) and left > (page_width * 0.15):
-                                        is_centered_hint = True
-
-                                heading_text = check_heading_user_defined(
-                                    line_dict, line_text, page_width, is_single_line_block,
-                                    False, False, # is_bold/is_italic hints are extracted inside checker for PDF
-                                    is_centered_hint, # Pass centering hint
-                                    heading_criteria
-                                )
-                                if heading_text is not None:
-                                    current_chapter_title_state = heading_text
-                                    extracted_data.append((heading_text, page_marker, heading_text)) # (text, marker, chapter_title)
-                                else:
-                                    try:
-                                        sentences = nltk.sent_tokenize(line_text)
-                                        for sentence in sentences:
-                                            sc = sentence.strip();
-                                            if sc: extracted_data.append((sc, page_marker, None))
-                                    except Exception as e: print(f"Warn: NLTK err PDF Pg {page_marker}: {e}"); extracted_data.append((line_text, page_marker, None))
-                except Exception as e_page: print(f"Error processing PDF page {adjusted_page_num}: {e_page}")
-        except Exception as e_main: print(f"Main PDF Extraction Error: {e_main}"); return None
-        finally:
-            if doc: doc.close()
-
-    elif file_extension == 'docx':
-        try:
-            document = docx.Document(io.BytesIO(file_content)); paragraph_index = 0
-            for para in document.paragraphs:
-                paragraph_index += 1; page_marker = f"Para_{paragraph_index}"
-                line_text = para.text.strip()
-                if not line_text or is_likely_metadata_or_footer(line_text): continue
-
-                # Get hints from DOCX paragraph properties
-                is_bold_hint = any(run.bold for run in para.runs if run.text.strip())
-                is_italic_hint = any(run.italic for run in para.runs if run.text.strip())
-                # Check alignment for centering hint
-                is_centered_hint = (para.alignment == WD_ALIGN_PARAGRAPH.CENTER) if para.alignment else False
-
-                heading_text = check_heading_user_defined(
-                    None, line_text, 0, False, # No PDF-specific info for DOCX
-                    is_bold_hint, is_italic_hint, is_centered_hint, # Pass hints
-                    heading_criteria
-                )
-                if heading_text is not None:
-                    current_chapter_title_state = heading_text
-                    extracted_data.append((heading_text, page_marker, heading_text))
-                else:
-                    try:
-                        sentences = nltk.sent_tokenize(line_text)
-                        for sentence in sentences:
-                            sc = sentence.strip();
-                            if sc: extracted_data.append((sc, page_marker, None))
-                    except Exception as e: print(f"Warn: NLTK err DOCX Para {page_marker}: {e}"); extracted_data.append((line_text, page_marker,pdf = (italic_chars / total_chars) > 0.6; line_is_bold_pdf = (bold_chars / total_chars) > 0.6
-        except Exception: pass
+        is_centered, line_is_bold_pdf, line_is_italic_pdf = pdf_line_style(line_dict, page_width)
+        if heading_criteria['require_centered'] and not is_centered: return None # Fail if required but not met
         if heading_criteria['require_italic'] and not line_is_italic_pdf: return None
         if heading_criteria['require_bold'] and not line_is_bold_pdf: return None
 
@@ -284,102 +126,273 @@ def check_heading_user_defined(
     return line_text
 
 
-# --- Main Extraction Function ---
-def extract_sentences_with_structure(
+# --- PDF Page Extraction ---
+def extract_pdf_page_items(page, page_marker, heading_criteria):
+    """ Extracts (text, page_marker, chapter_title_or_None) items from a single PDF page. """
+    items = []
+    page_width = page.rect.width
+    blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT | fitz.TEXT_PRESERVE_LIGATURES)["blocks"]
+    for b in blocks:
+        if b['type'] == 0:
+            is_single_line_block = len(b['lines']) == 1
+            for l in b["lines"]:
+                line_dict = l
+                line_text_raw = "".join(s["text"] for s in l["spans"]).strip()
+                if not line_text_raw or is_likely_metadata_or_footer(line_text_raw): continue
+
+                # Check heading
+                heading_text = check_heading_user_defined(
+                    line_dict, line_text_raw, page_width, is_single_line_block,
+                    False, False, None, # Pass False/None for DOCX-specific params
+                    heading_criteria
+                )
+
+                if heading_text is not None:
+                    items.append((heading_text, page_marker, heading_text))
+                else: # Regular text
+                    try: # Tokenize
+                        sentences = nltk.sent_tokenize(line_text_raw)
+                        for sentence in sentences:
+                            sc = sentence.strip();
+                            if sc: items.append((sc, page_marker, None))
+                    except Exception as e_nltk: print(f"Warn: NLTK PDF {page_marker}: {e_nltk}"); items.append((line_text_raw, page_marker, None))
+    return items
+
+
+# --- Main Extraction Functions ---
+def iter_page_items(
     file_name, file_content,
     heading_criteria, # Pass the dictionary of user choices
     start_skip=0, end_skip=0, start_page_offset=1
     ):
-    extracted_data = []
-    current_chapter_title_state = None
-    doc = None
-
+    """
+    Yields the extracted (text, page_num_marker, chapter_title_or_None) items one PDF page
+    (or DOCX paragraph) at a time, so callers never need the whole list.
+    Raises ValueError if the file cannot be read or its type is unsupported.
+    """
     file_extension = file_name.split('.')[-1].lower()
 
     # --- PDF Processing ---
     if file_extension == 'pdf':
+        try: doc = fitz.open(stream=file_content, filetype="pdf")
+        except Exception as e_main: raise ValueError(f"Main PDF Error: {e_main}")
         try:
-            doc = fitz.open(stream=file_content, filetype="pdf")
             total_pages = len(doc)
-            for page_num_0based, page in enumerate(doc):
-                # ...(page skipping)...
-                if page_num_0based < start_skip: continue
-                if page_num_0based >= total_pages - end_skip: break
+            for page_num_0based in range(start_skip, total_pages - end_skip):
                 adjusted_page_num = page_num_0based - start_skip + start_page_offset
-                page_marker = adjusted_page_num
+                try: page_items = extract_pdf_page_items(doc.load_page(page_num_0based), adjusted_page_num, heading_criteria)
+                except Exception as e_page: print(f"Error processing PDF page {adjusted_page_num}: {e_page}"); continue
+                yield page_items
+        finally: doc.close()
+
+    # --- DOCX Processing ---
+    elif file_extension == 'docx':
+        try: document = docx.Document(io.BytesIO(file_content))
+        except Exception as e_main: raise ValueError(f"Main DOCX Error: {e_main}")
+        paragraph_index = 0
+        for para in document.paragraphs:
+            paragraph_index += 1
+            page_marker = f"Para_{paragraph_index}"
+            line_text = para.text.strip()
+            if not line_text or is_likely_metadata_or_footer(line_text): continue
+
+            is_bold_hint = any(run.bold for run in para.runs if run.text.strip())
+            is_italic_hint = any(run.italic for run in para.runs if run.text.strip())
+            # Get alignment (default to LEFT if not set)
+            para_alignment = para.alignment if para.alignment is not None else WD_ALIGN_PARAGRAPH.LEFT
+
+            # Check heading
+            heading_text = check_heading_user_defined(
+                None, line_text, 0, False, # Pass None/False for PDF-specific params
+                is_bold_hint, is_italic_hint, # Pass style hints
+                para_alignment, # Pass alignment
+                heading_criteria
+            )
+
+            if heading_text is not None:
+                yield [(heading_text, page_marker, heading_text)]
+            else: # Regular text
+                try: # Tokenize
+                    sentences = nltk.sent_tokenize(line_text)
+                    yield [(sc, page_marker, None) for sc in (sentence.strip() for sentence in sentences) if sc]
+                except Exception as e_nltk: print(f"Warn: NLTK DOCX {page_marker}: {e_nltk}"); yield [(line_text, page_marker, None)]
+
+    # --- Unsupported ---
+    else: raise ValueError(f"Error: Unsupported file type: .{file_extension}")
+
+
+def iter_sentences_with_structure(file_name, file_content, heading_criteria, start_skip=0, end_skip=0, start_page_offset=1):
+    """ Item-by-item form of iter_page_items (e.g. for DocumentText.from_items). """
+    for page_items in iter_page_items(file_name, file_content, heading_criteria, start_skip, end_skip, start_page_offset):
+        yield from page_items
+
+
+def extract_sentences_with_structure(
+    file_name, file_content,
+    heading_criteria, # Pass the dictionary of user choices
+    start_skip=0, end_skip=0, start_page_offset=1
+    ):
+    try: extracted_data = list(iter_sentences_with_structure(file_name, file_content, heading_criteria, start_skip, end_skip, start_page_offset))
+    except Exception as e_main: print(e_main); return None
+
+    print(f"Extraction complete. Found {len(extracted_data)} items.")
+    return extracted_data
+
+
+# --- Page-Level Cache (Incremental Re-processing) ---
+def page_content_hash(doc, page, criteria_key):
+    """
+    Hash of what a page draws: its content stream(s), the streams of the Form XObjects it
+    uses (pages that only say 'q /fzFrm0 Do Q' differ there), and its fonts with their
+    ToUnicode maps, plus the heading criteria. Falls back to the page text.
+    """
+    h = hashlib.sha1(criteria_key.encode("utf-8"))
+    try:
+        content = b"".join(doc.xref_stream(xref) or b"" for xref in page.get_contents())
+        for xref, name, *_ in page.get_xobjects(): # Includes nested forms
+            h.update(name.encode("utf-8")); h.update(doc.xref_stream(xref) or b"")
+        for font in page.get_fonts(full=True):
+            font_xref = font[0]
+            if font_xref <= 0: continue
+            h.update(font[4].encode("utf-8")); h.update(doc.xref_object(font_xref, compressed=True).encode("utf-8"))
+            to_unicode = doc.xref_get_key(font_xref, "ToUnicode")
+            if to_unicode[0] == "xref": h.update(doc.xref_stream(int(to_unicode[1].split()[0])) or b"")
+    except Exception: content = b""
+    if not content.strip(): content = page.get_text("text").encode("utf-8")
+    h.update(content)
+    return h.hexdigest()
+
+
+def _load_cached_page(cache_dir, page_hash):
+    try:
+        with open(os.path.join(cache_dir, "pages", f"{page_hash}.json"), encoding="utf-8") as f: return json.load(f)
+    except (OSError, ValueError): return None
+
+
+def _save_cached_page(cache_dir, page_hash, page_items):
+    pages_dir = os.path.join(cache_dir, "pages")
+    os.makedirs(pages_dir, exist_ok=True)
+    final_path = os.path.join(pages_dir, f"{page_hash}.json")
+    tmp_path = f"{final_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f: json.dump(page_items, f, ensure_ascii=False)
+    os.replace(tmp_path, final_path) # Atomic, so concurrent jobs never read half a file
+
+
+def extract_sentences_incremental(
+    file_name, file_content, heading_criteria, cache_dir,
+    start_skip=0, end_skip=0, start_page_offset=1
+    ):
+    """
+    Like extract_sentences_with_structure, but PDF pages are cached under cache_dir keyed by
+    page_content_hash, so a revised edition only re-extracts the pages that changed.
+    Output: (extracted_data, stats) with stats {'pages', 'reused_pages', 'extracted_pages'};
+            (None, stats) on failure. DOCX files are always extracted in full.
+    """
+    stats = {"pages": 0, "reused_pages": 0, "extracted_pages": 0}
+    if file_name.split('.')[-1].lower() != 'pdf':
+        return extract_sentences_with_structure(file_name, file_content, heading_criteria, start_skip, end_skip, start_page_offset), stats
+
+    criteria_key = json.dumps(heading_criteria, sort_keys=True, default=str)
+    extracted_data = []
+    doc = None
+    try:
+        doc = fitz.open(stream=file_content, filetype="pdf")
+        total_pages = len(doc)
+        for page_num_0based, page in enumerate(doc):
+            if page_num_0based < start_skip: continue
+            if page_num_0based >= total_pages - end_skip: break
+            adjusted_page_num = page_num_0based - start_skip + start_page_offset
+            stats["pages"] += 1
+            try:
+                page_hash = page_content_hash(doc, page, criteria_key)
+                cached = _load_cached_page(cache_dir, page_hash)
+                if cached is not None: # Stored without page marker, so moved pages still hit
+                    extracted_data.extend((text, adjusted_page_num, text if is_heading else None) for text, is_heading in cached)
+                    stats["reused_pages"] += 1
+                    continue
+                page_items = extract_pdf_page_items(page, adjusted_page_num, heading_criteria)
+                extracted_data.extend(page_items)
+                stats["extracted_pages"] += 1
+                _save_cached_page(cache_dir, page_hash, [[text, title is not None] for text, _, title in page_items])
+            except Exception as e_page: print(f"Error processing PDF page {adjusted_page_num}: {e_page}")
+    except Exception as e_main: print(f"Main PDF Error: {e_main}"); return None, stats
+    finally:
+        if doc: doc.close()
+
+    print(f"Incremental extraction: {stats['reused_pages']} cached / {stats['extracted_pages']} extracted pages.")
+    return extracted_data, stats
+
+
+# --- Sampled Preview (Heading Criteria Tuning) ---
+def sample_page_indices(first_index, end_index, n_samples, lead_pages=3):
+    """ First lead_pages indices of [first_index, end_index), then evenly spaced ones up to n_samples in total. """
+    if end_index <= first_index or n_samples <= 0: return []
+    lead = list(range(first_index, min(end_index, first_index + min(lead_pages, n_samples))))
+    remaining = n_samples - len(lead)
+    rest_start = first_index + len(lead)
+    if remaining <= 0 or rest_start >= end_index: return lead
+    step = max(1, (end_index - rest_start) // remaining) # Every k-th page of the rest of the book
+    return lead + list(range(rest_start, end_index, step))[:remaining]
+
+
+def preview_heading_detection(
+    file_name, file_content, heading_criteria,
+    start_skip=0, end_skip=0, start_page_offset=1, n_samples=20, lead_pages=3
+    ):
+    """
+    Classifies the lines of a stratified page sample without sentence tokenizing, for fast tuning.
+    Status per line: 'heading' (check_heading_user_defined matched), 'dropped'
+    (is_likely_metadata_or_footer) or 'text'. DOCX files sample paragraphs the same way.
+    Output: List of dictionaries [{'page_number': ..., 'status': ..., 'line': ...}], None on failure.
+    """
+    preview_rows = []
+    file_extension = file_name.split('.')[-1].lower()
+
+    if file_extension == 'pdf':
+        doc = None
+        try:
+            doc = fitz.open(stream=file_content, filetype="pdf") # Pages are only parsed when loaded
+            for page_num_0based in sample_page_indices(start_skip, len(doc) - end_skip, n_samples, lead_pages):
+                page = doc.load_page(page_num_0based)
+                page_marker = page_num_0based - start_skip + start_page_offset
                 page_width = page.rect.width
                 try:
                     blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT | fitz.TEXT_PRESERVE_LIGATURES)["blocks"]
                     for b in blocks:
-                        if b['type'] == 0:
-                            is_single_line_block = len(b['lines']) == 1
-                            for l in b["lines"]:
-                                line_dict = l
-                                line_text_raw = "".join(s["text"] for s in l["spans"]).strip()
-                                if not line_text_raw or is_likely_metadata_or_footer(line_text_raw): continue
-
-                                # Check heading
-                                heading_text = check_heading_user_defined(
-                                    line_dict, line_text_raw, page_width, is_single_line_block,
-                                    False, False, None, # Pass False/None for DOCX-specific params
-                                    heading_criteria
-                                )
-
-                                if heading_text is not None:
-                                    current_chapter_title_state = heading_text
-                                    extracted_data.append((heading_text, page_marker, heading_text))
-                                else: # Regular text
-                                    try: # Tokenize
-                                        sentences = nltk.sent_tokenize(line_text_raw)
-                                        for sentence in sentences:
-                                            sc = sentence.strip();
-                                            if sc: extracted_data.append((sc, page_marker, None))
-                                    except Exception as e_nltk: print(f"Warn: NLTK PDF {page_marker}: {e_nltk}"); extracted_data.append((line_text_raw, page_marker, None))
-                except Exception as e_page: print(f"Error processing PDF page {adjusted_page_num}: {e_page}")
-        except Exception as e_main: print(f"Main PDF Error: {e_main}"); return None
+                        if b['type'] != 0: continue
+                        is_single_line_block = len(b['lines']) == 1
+                        for l in b["lines"]:
+                            line_text_raw = "".join(s["text"] for s in l["spans"]).strip()
+                            if not line_text_raw: continue
+                            if is_likely_metadata_or_footer(line_text_raw): status = 'dropped'
+                            elif check_heading_user_defined(l, line_text_raw, page_width, is_single_line_block,
+                                                            False, False, None, heading_criteria) is not None: status = 'heading'
+                            else: status = 'text'
+                            preview_rows.append({"page_number": page_marker, "status": status, "line": line_text_raw})
+                except Exception as e_page: print(f"Error previewing PDF page {page_marker}: {e_page}")
+        except Exception as e_main: print(f"Main PDF Preview Error: {e_main}"); return None
         finally:
             if doc: doc.close()
 
-    # --- DOCX Processing ---
     elif file_extension == 'docx':
         try:
-            document = docx.Document(io.BytesIO(file_content))
-            paragraph_index = 0
-            for para in document.paragraphs:
-                paragraph_index += 1
-                page_marker = f"Para_{paragraph_index}"
+            paragraphs = docx.Document(io.BytesIO(file_content)).paragraphs
+            for para_index in sample_page_indices(0, len(paragraphs), n_samples, lead_pages):
+                para = paragraphs[para_index]
                 line_text = para.text.strip()
-                if not line_text or is_likely_metadata_or_footer(line_text): continue
-
-                is_bold_hint = any(run.bold for run in para.runs if run.text.strip())
-                is_italic_hint = any(run.italic for run in para.runs if run.text.strip())
-                # Get alignment (default to LEFT if not set)
-                para_alignment = para.alignment if para.alignment is not None else WD_ALIGN_PARAGRAPH.LEFT
-
-                # Check heading
-                heading_text = check_heading_user_defined(
-                    None, line_text, 0, False, # Pass None/False for PDF-specific params
-                    is_bold_hint, is_italic_hint, # Pass style hints
-                    para_alignment, # Pass alignment
-                    heading_criteria
-                )
-
-                if heading_text is not None:
-                    current_chapter_title_state = heading_text
-                    extracted_data.append((heading_text, page_marker, heading_text))
-                else: # Regular text
-                    try: # Tokenize
-                        sentences = nltk.sent_tokenize(line_text)
-                        for sentence in sentences:
-                            sc = sentence.strip()
-                            if sc: extracted_data.append((sc, page_marker, None))
-                    except Exception as e_nltk: print(f"Warn: NLTK DOCX {page_marker}: {e_nltk}"); extracted_data.append((line_text, page_marker, None))
-        except Exception as e_main: print(f"Main DOCX Error: {e_main}"); return None
+                if not line_text: continue
+                if is_likely_metadata_or_footer(line_text): status = 'dropped'
+                else:
+                    is_bold_hint = any(run.bold for run in para.runs if run.text.strip())
+                    is_italic_hint = any(run.italic for run in para.runs if run.text.strip())
+                    para_alignment = para.alignment if para.alignment is not None else WD_ALIGN_PARAGRAPH.LEFT
+                    heading_text = check_heading_user_defined(None, line_text, 0, False, is_bold_hint, is_italic_hint,
+                                                              para_alignment, heading_criteria)
+                    status = 'heading' if heading_text is not None else 'text'
+                preview_rows.append({"page_number": f"Para_{para_index + 1}", "status": status, "line": line_text})
+        except Exception as e_main: print(f"Main DOCX Preview Error: {e_main}"); return None
 
-    # --- Unsupported ---
     else: print(f"Error: Unsupported file type: .{file_extension}"); return None
-
-    print(f"Extraction complete. Found {len(extracted_data)} items.")
-    return extracted_data
+    return preview_rows
 
 # --- END OF FILE file_processor.py ---
@@ -0,0 +1,224 @@
+# --- START OF FILE heading_tuner.py ---
+import io
+import re
+import math
+import hashlib
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+import docx
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from file_processor import is_likely_metadata_or_footer, pdf_line_style
+
+# --- Search Space ---
+STYLE_OPTIONS = [(False, False), (True, False), (False, True)] # (require_bold, require_italic)
+LAYOUT_OPTIONS = [(False, False), (True, False), (False, True), (True, True)] # (require_centered, require_isolated)
+CASE_OPTIONS = [(False, False), (True, False), (False, True)] # (require_title_case, require_all_caps)
+LENGTH_OPTIONS = [(1, 6), (1, 10), (1, 15), (2, 12)] # (min_words, max_words)
+PARALLEL_MIN_COMBOS = 64 # Below this, worker start-up costs more than it saves
+
+FEATURE_CACHE_ENTRIES = 4 # Books whose line features stay in memory (each holds one dict per line)
+
+_FEATURE_CACHE = OrderedDict() # (content hash, skips, offset) -> features, least recently used first
+
+
+# --- Line Features (parsed once per book) ---
+def extract_line_features(file_name, file_content, start_skip=0, end_skip=0, start_page_offset=1):
+    """
+    Parses the book once into per-line features, the same ones check_heading_user_defined looks at.
+    Output: Dictionary {'lines': [{'text', 'page', 'words', 'bold', 'italic', 'centered', 'isolated',
+            'title_case', 'all_caps'}], 'n_pages': int, 'outline': [(title, page_marker)]}, None on failure.
+    """
+    cache_key = (hashlib.sha1(file_content).hexdigest(), file_name.split('.')[-1].lower(), start_skip, end_skip, start_page_offset)
+    if cache_key in _FEATURE_CACHE:
+        _FEATURE_CACHE.move_to_end(cache_key); return _FEATURE_CACHE[cache_key]
+
+    lines = []; outline = []; n_pages = 0
+    def add_line(text, page, bold, italic, centered, isolated):
+        if is_likely_metadata_or_footer(text): return # Never a heading candidate
+        lines.append({
+            "text": text, "page": page, "words": len(text.split()),
+            "bold": bold, "italic": italic, "centered": centered, "isolated": isolated,
+            "title_case": text.istitle(), "all_caps": bool(text.isupper() and re.search("[A-Z]", text))
+        })
+
+    if cache_key[1] == 'pdf':
+        doc = None
+        try:
+            doc = fitz.open(stream=file_content, filetype="pdf")
+            total_pages = len(doc)
+            for page_num_0based in range(start_skip, total_pages - end_skip):
+                page = doc.load_page(page_num_0based)
+                page_marker = page_num_0based - start_skip + start_page_offset
+                page_width = page.rect.width
+                n_pages += 1
+                try:
+                    blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT | fitz.TEXT_PRESERVE_LIGATURES)["blocks"]
+                except Exception as e_page: print(f"Error reading PDF page {page_marker}: {e_page}"); continue
+                for b in blocks:
+                    if b['type'] != 0: continue
+                    is_single_line_block = len(b['lines']) == 1
+                    for l in b["lines"]:
+                        line_text = "".join(s["text"] for s in l["spans"]).strip()
+                        if not line_text: continue
+                        centered, bold, italic = pdf_line_style(l, page_width) # Same rules as check_heading_user_defined
+                        add_line(line_text, page_marker, bold, italic, centered, is_single_line_block)
+            for _, toc_title, toc_page in doc.get_toc(simple=True):
+                if start_skip < toc_page <= total_pages - end_skip: # TOC pages are 1-based
+                    outline.append((toc_title.strip(), toc_page - 1 - start_skip + start_page_offset))
+        except Exception as e_main: print(f"Main PDF Feature Error: {e_main}"); return None
+        finally:
+            if doc: doc.close()
+
+    elif cache_key[1] == 'docx':
+        try:
+            paragraphs = docx.Document(io.BytesIO(file_content)).paragraphs
+            for para_index, para in enumerate(paragraphs):
+                line_text = para.text.strip()
+                if not line_text: continue
+                add_line(line_text, para_index + 1,
+                         any(run.bold for run in para.runs if run.text.strip()),
+                         any(run.italic for run in para.runs if run.text.strip()),
+                         para.alignment == WD_ALIGN_PARAGRAPH.CENTER,
+                         True) # Isolation is not checked for DOCX
+            n_pages = max(1, len(paragraphs) // 30) # ~30 paragraphs per page for density scoring
+        except Exception as e_main: print(f"Main DOCX Feature Error: {e_main}"); return None
+
+    else: print(f"Error: Unsupported file type: .{cache_key[1]}"); return None
+
+    features = {"lines": lines, "n_pages": max(1, n_pages), "outline": outline}
+    _FEATURE_CACHE[cache_key] = features
+    while len(_FEATURE_CACHE) > FEATURE_CACHE_ENTRIES: _FEATURE_CACHE.popitem(last=False)
+    return features
+
+
+def _feature_bitsets(lines):
+    """One int per feature, bit i set when line i has it: a combination is evaluated on all lines with a few ANDs."""
+    bitsets = {name: 0 for name in ("bold", "italic", "centered", "isolated", "title_case", "all_caps")}
+    word_bitsets = {}
+    for i, line in enumerate(lines):
+        bit = 1 << i
+        for name in bitsets:
+            if line[name]: bitsets[name] |= bit
+        word_bitsets[line["words"]] = word_bitsets.get(line["words"], 0) | bit
+    return bitsets, word_bitsets
+
+
+def criteria_from_combo(combo):
+    """Builds a full heading_criteria dict (as app.py passes it) from one search-space combination."""
+    (bold, italic), (centered, isolated), (title_case, all_caps), (min_words, max_words) = combo
+    return {
+        "require_bold": bold, "require_italic": italic,
+        "require_title_case": title_case, "require_all_caps": all_caps,
+        "require_centered": centered, "require_isolated": isolated,
+        "min_words": min_words, "max_words": max_words, "keyword_pattern": None,
+        "use_style": bold or italic, "use_case": title_case or all_caps, "use_layout": centered or isolated,
+        "use_length": True, "use_keywords": False
+    }
+
+
+# --- Plausibility Scoring ---
+def _normalize_title(text):
+    return re.sub(r"[\W_]+", " ", text).strip().lower()
+
+
+def score_headings(headings, n_pages, outline):
+    """
+    Scores a detected heading list [(text, page)] by plausibility: count per page, regular spacing,
+    few headings sharing a page, unique texts and (if the PDF has one) agreement with its outline.
+    Output: (score in [0, 1], signal dictionary)
+    """
+    n = len(headings)
+    if n == 0: return 0.0, {"headings": 0}
+    # Count: a broad prior around one heading per ~12 pages
+    density = n / n_pages
+    count_score = math.exp(-(math.log(density / (1 / 12.0)) ** 2) / (2 * 1.2 ** 2))
+    if n < 2: count_score *= 0.3
+    # Spacing: regular gaps and few headings crowded on the same page
+    pages = [p for _, p in headings if isinstance(p, int)]
+    gaps = [b - a for a, b in zip(pages, pages[1:])]
+    if gaps:
+        same_page = sum(1 for g in gaps if g == 0) / len(gaps)
+        mean_gap = sum(gaps) / len(gaps)
+        cv = math.sqrt(sum((g - mean_gap) ** 2 for g in gaps) / len(gaps)) / mean_gap if mean_gap > 0 else 5.0
+        spacing_score = (1 - same_page) / (1 + cv)
+    else: spacing_score = 0.5
+    # Uniqueness: running headers repeat on every page
+    uniqueness = len({_normalize_title(t) for t, _ in headings}) / n
+    signals = {"headings": n, "count": round(count_score, 3), "spacing": round(spacing_score, 3), "uniqueness": round(uniqueness, 3)}
+
+    if outline:
+        outline_norm = [(_normalize_title(t), p) for t, p in outline]
+        def matches(text, page):
+            nt = _normalize_title(text)
+            return any(nt and (nt in ot or ot in nt) and abs(page - op) <= 1 for ot, op in outline_norm)
+        matched = sum(1 for t, p in headings if isinstance(p, int) and matches(t, p))
+        precision = matched / n; recall = min(1.0, matched / len(outline))
+        outline_f1 = 2 * precision * recall / (precision + recall) if matched else 0.0
+        signals["outline_f1"] = round(outline_f1, 3)
+        score = 0.2 * count_score + 0.2 * spacing_score + 0.2 * uniqueness + 0.4 * outline_f1
+    else:
+        score = 0.35 * count_score + 0.35 * spacing_score + 0.3 * uniqueness
+    return score, signals
+
+
+def _score_combo_batch(args):
+    combos, lines, bitsets, word_bitsets, n_pages, outline = args
+    all_lines = (1 << len(lines)) - 1
+    results = []
+    for combo in combos:
+        (bold, italic), (centered, isolated), (title_case, all_caps), (min_words, max_words) = combo
+        mask = all_lines
+        for required, name in ((bold, "bold"), (italic, "italic"), (centered, "centered"), (isolated, "isolated"),
+                               (title_case, "title_case"), (all_caps, "all_caps")):
+            if required: mask &= bitsets[name]
+        length_mask = 0
+        for words, bits in word_bitsets.items():
+            if min_words <= words <= max_words: length_mask |= bits
+        mask &= length_mask
+        n_matched = bin(mask).count("1")
+        if n_matched > 3 * n_pages: # Hopelessly many headings: not worth scoring
+            results.append((0.0, combo, {"headings": n_matched})); continue
+        headings = []
+        while mask: # Walk set bits only
+            low_bit = mask & -mask; i = low_bit.bit_length() - 1
+            headings.append((lines[i]["text"], lines[i]["page"])); mask ^= low_bit
+        score, signals = score_headings(headings, n_pages, outline)
+        results.append((score, combo, signals))
+    return results
+
+
+def auto_tune_heading_criteria(features, max_workers=1, top_n=5):
+    """
+    Evaluates every criteria combination against the cached line features and ranks them.
+    Each combination is tested on all lines at once (bitset ANDs); with max_workers != 1 the
+    combinations are also split across worker processes. Ties prefer fewer required criteria.
+    Output: List of up to top_n dictionaries [{'score', 'heading_criteria', 'signals'}], best first.
+    """
+    if not features or not features["lines"]: return []
+    lines = features["lines"]
+    bitsets, word_bitsets = _feature_bitsets(lines)
+    combos = list(itertools.product(STYLE_OPTIONS, LAYOUT_OPTIONS, CASE_OPTIONS, LENGTH_OPTIONS))
+    shared = (lines, bitsets, word_bitsets, features["n_pages"], features["outline"])
+
+    if max_workers == 1 or len(combos) < PARALLEL_MIN_COMBOS:
+        results = _score_combo_batch((combos,) + shared)
+    else:
+        n_batches = max_workers or 4
+        batches = [combos[k::n_batches] for k in range(n_batches)]
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                results = [r for batch_results in pool.map(_score_combo_batch, [(b,) + shared for b in batches]) for r in batch_results]
+        except Exception as e: # e.g. no process support in this environment
+            print(f"Warn: parallel tuning unavailable ({e}), scoring in-process.")
+            results = _score_combo_batch((combos,) + shared)
+
+    def n_required(combo):
+        return sum(flag for pair in combo[:3] for flag in pair)
+    results.sort(key=lambda r: (-r[0], n_required(r[1]), abs(r[1][3][1] - 10))) # Then the default 10-word max
+    return [{"score": round(score, 4), "heading_criteria": criteria_from_combo(combo), "signals": signals}
+            for score, combo, signals in results[:top_n]]
+# --- END OF FILE heading_tuner.py ---
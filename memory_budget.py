@@ -0,0 +1,195 @@
+# --- START OF FILE memory_budget.py ---
+"""
+Memory-budgeted token chunking: extracted items are buffered only up to a budget, then chunked
+and flushed straight to the CSV writer, so the full item list, chunk list and CSV never coexist.
+Peak RSS is recorded per stage.
+"""
+import os
+import sys
+import csv
+import time
+import threading
+from contextlib import contextmanager
+
+from file_processor import iter_page_items
+from document_model import DocumentText, chunk_document, iter_span_records, UNKNOWN_CHAPTER
+from tokenizer_registry import calibrate_approximate_tokenizer
+
+try:
+    import resource # Unix only; RSS figures are None elsewhere
+except ImportError:
+    resource = None
+
+BUFFER_FRACTION = 0.25 # Share of the budget for buffered items; chunking a segment needs a few times that
+CSV_COLUMNS = ['chunk_text', 'page_number', 'title']
+
+
+# --- RSS Accounting ---
+SAMPLE_INTERVAL = 0.01 # Seconds between RSS samples where the high-water mark cannot be reset
+
+
+def peak_rss_mb():
+    """RSS high-water mark in MB: VmHWM (Linux, since the last reset_peak_rss), else ru_maxrss (process lifetime)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"): return round(int(line.split()[1]) / 1024, 1)
+    except (OSError, ValueError, IndexError): pass
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # KB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def reset_peak_rss():
+    """Resets VmHWM to the current RSS (Linux 4.0+). Output: True if the reset worked."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f: f.write("5")
+        return True
+    except OSError: return False
+
+
+def current_rss_mb():
+    """Current RSS in MB from /proc (Linux), else None."""
+    try:
+        with open("/proc/self/statm") as f: resident_pages = int(f.read().split()[1])
+        return round(resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError, AttributeError): return None
+
+
+class _RssSampler(threading.Thread):
+    """ Polls current RSS and keeps the maximum; used where the high-water mark cannot be reset. """
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.max_rss_mb = current_rss_mb(); self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            rss = current_rss_mb()
+            if rss is not None: self.max_rss_mb = max(self.max_rss_mb or 0.0, rss)
+
+    def stop(self):
+        self.stopped.set(); self.join()
+        return self.max_rss_mb
+
+
+_active_stages = 0 # Stages running in this process (e.g. concurrent Streamlit sessions)
+_active_lock = threading.Lock()
+
+
+class StageMemory:
+    """
+    Per-stage time and peak RSS. The high-water mark is reset when a stage starts, so 'peak_rss_mb'
+    is the peak reached inside that stage (over all its calls), not the process lifetime peak.
+    The mark is process-wide: a stage only resets it when no other stage is running, otherwise (and
+    without a resettable mark, i.e. non-Linux) RSS is sampled by a thread during the stage instead.
+    RSS is per process either way, so concurrent runs count each other's memory.
+    """
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        stats = self.stages.setdefault(name, {"stage": name, "calls": 0, "seconds": 0.0, "peak_rss_mb": None, "end_rss_mb": None})
+        global _active_stages
+        with _active_lock:
+            alone = _active_stages == 0
+            _active_stages += 1
+        sampler = None
+        if not (alone and reset_peak_rss()): sampler = _RssSampler(); sampler.start() # Never wipe another run's peak
+        start_time = time.perf_counter()
+        try: yield
+        finally:
+            stage_peak = sampler.stop() if sampler else peak_rss_mb()
+            with _active_lock: _active_stages -= 1
+            rss_now = current_rss_mb()
+            stats["calls"] += 1; stats["seconds"] += time.perf_counter() - start_time
+            if stage_peak is not None: stats["peak_rss_mb"] = max(stats["peak_rss_mb"] or 0.0, stage_peak)
+            if rss_now is not None: stats["end_rss_mb"] = max(stats["end_rss_mb"] or 0.0, rss_now)
+
+    def peak_mb(self):
+        peaks = [s["peak_rss_mb"] for s in self.stages.values() if s["peak_rss_mb"] is not None]
+        return max(peaks) if peaks else None
+
+    def report(self):
+        return [{**s, "seconds": round(s["seconds"], 3)} for s in self.stages.values()]
+
+
+def _item_nbytes(item):
+    return sys.getsizeof(item) + sys.getsizeof(item[0])
+
+
+# --- Budgeted Pipeline ---
+def process_with_memory_budget(
+    file_name, file_content, heading_criteria, tokenizer, out_csv,
+    memory_budget_mb, target_tokens, overlap_sentences, oversize_overlap_tokens=0,
+    overlap_tokens=None, overlap_cap_tokens=None,
+    start_skip=0, end_skip=0, start_page_offset=1, include_page_numbers=True, calibrate=False, pages=None
+    ):
+    """
+    Token chunking under a memory budget. Items are buffered until they reach BUFFER_FRACTION of the
+    budget, then the buffer is chunked (DocumentText + chunk_document) up to the last chapter heading
+    and written to out_csv (a path or text file object). Chapters start fresh chunks anyway, so the
+    output equals unbudgeted chunking. A single chapter larger than the buffer is cut where the buffer
+    fills; only there does one chunk end early and the next start without overlap.
+    With calibrate=True, tokenizer is the reference for an approximate tokenizer calibrated on the first segment.
+    pages replaces the default extraction with another iterable of per-page item lists (e.g. iter_pages_supervised).
+    Output: Summary dictionary {'items', 'chunks', 'flushes', 'forced_flushes', 'peak_buffer_mb', 'peak_rss_mb', 'stages'}, None on failure.
+    """
+    buffer_limit = memory_budget_mb * 1024 * 1024 * BUFFER_FRACTION
+    meter = StageMemory()
+    summary = {"items": 0, "chunks": 0, "flushes": 0, "forced_flushes": 0, "peak_buffer_mb": 0.0}
+    columns = CSV_COLUMNS if include_page_numbers else [c for c in CSV_COLUMNS if c != 'page_number']
+    state = {"tokenizer": tokenizer, "calibrate": calibrate}
+
+    out_file = open(out_csv, "w", newline="", encoding="utf-8") if isinstance(out_csv, (str, os.PathLike)) else out_csv
+    writer = csv.writer(out_file); writer.writerow(columns)
+
+    def flush(segment):
+        if not any(title is None for _, _, title in segment): return
+        with meter.stage("chunk"):
+            if state["calibrate"]:
+                state["tokenizer"] = calibrate_approximate_tokenizer([t for t, _, ch in segment if ch is None], state["tokenizer"])
+                state["calibrate"] = False
+            doc_text = DocumentText.from_items(segment)
+            summary["peak_buffer_mb"] = max(summary["peak_buffer_mb"], round(doc_text.nbytes() / (1024 * 1024), 2))
+            spans = chunk_document(doc_text, state["tokenizer"], target_tokens, overlap_sentences, oversize_overlap_tokens,
+                                   overlap_tokens=overlap_tokens, overlap_cap_tokens=overlap_cap_tokens)
+        with meter.stage("write"):
+            for record in iter_span_records(doc_text, spans): writer.writerow([record[c] for c in columns])
+            out_file.flush()
+        summary["chunks"] += len(spans); summary["flushes"] += 1
+
+    buffer = []; buffer_bytes = 0
+    last_cut = 0 # Buffer index of the latest heading that starts a new chapter
+    current_chapter = UNKNOWN_CHAPTER
+    if pages is None: pages = iter_page_items(file_name, file_content, heading_criteria, start_skip, end_skip, start_page_offset)
+    pages = iter(pages)
+    try:
+        while True:
+            with meter.stage("extract"): page_items = next(pages, None)
+            if page_items is None: break
+            for item in page_items:
+                if item[2] is not None and item[2] != current_chapter: # Same-title headings don't split chunks
+                    last_cut = len(buffer); current_chapter = item[2]
+                buffer.append(item); buffer_bytes += _item_nbytes(item)
+            summary["items"] += len(page_items)
+            summary["peak_buffer_mb"] = max(summary["peak_buffer_mb"], round(buffer_bytes / (1024 * 1024), 2))
+            if buffer_bytes < buffer_limit: continue
+            if last_cut > 0: # Clean cut at a chapter boundary
+                flush(buffer[:last_cut]); buffer = buffer[last_cut:]; last_cut = 0
+                buffer_bytes = sum(_item_nbytes(item) for item in buffer)
+            if buffer_bytes >= buffer_limit: # One chapter fills the buffer: cut here, keep its title for the rest
+                last_marker = buffer[-1][1]
+                flush(buffer); summary["forced_flushes"] += 1
+                buffer = [] if current_chapter == UNKNOWN_CHAPTER else [(current_chapter, last_marker, current_chapter)]
+                buffer_bytes = sum(_item_nbytes(item) for item in buffer); last_cut = 0
+        flush(buffer); buffer = []
+    except ValueError as e: print(f"ERROR: {e}"); return None
+    finally:
+        if out_file is not out_csv: out_file.close()
+
+    summary["peak_rss_mb"] = meter.peak_mb()
+    summary["stages"] = meter.report()
+    print(f"Budgeted processing complete. {summary['items']} items, {summary['chunks']} chunks in {summary['flushes']} flushes.")
+    return summary
+# --- END OF FILE memory_budget.py ---
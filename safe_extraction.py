@@ -0,0 +1,157 @@
+# --- START OF FILE safe_extraction.py ---
+"""
+Hardened PDF extraction: pages run in supervised worker processes with a per-page wall-clock
+timeout and an address-space limit, so a hanging or crashing MuPDF page only loses that page.
+"""
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+
+import fitz
+
+from file_processor import extract_pdf_page_items, iter_page_items
+
+try:
+    import resource # Unix only; memory limits are skipped elsewhere
+except ImportError:
+    resource = None
+
+DEFAULT_PAGE_TIMEOUT = 30.0 # Seconds per page
+DEFAULT_MEMORY_LIMIT_MB = 2048 # Per worker process
+
+
+def _page_worker(conn, file_content, heading_criteria, memory_limit_mb):
+    """Worker loop: receives (page_index, page_marker), sends back ('ok'|'error', page_index, payload)."""
+    if resource is not None and memory_limit_mb:
+        limit = int(memory_limit_mb) * 1024 * 1024
+        try: resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError) as e: print(f"Warn: could not set worker memory limit: {e}")
+    doc = fitz.open(stream=file_content, filetype="pdf")
+    try:
+        while True:
+            task = conn.recv()
+            if task is None: break
+            page_index, page_marker = task
+            try: conn.send(("ok", page_index, extract_pdf_page_items(doc.load_page(page_index), page_marker, heading_criteria)))
+            except MemoryError: conn.send(("error", page_index, "memory limit exceeded"))
+            except Exception as e: conn.send(("error", page_index, f"{type(e).__name__}: {e}"))
+    except (EOFError, KeyboardInterrupt): pass
+    finally: doc.close()
+
+
+class _Worker:
+    """ One supervised process plus the page it is working on. """
+    def __init__(self, ctx, file_content, heading_criteria, memory_limit_mb):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_page_worker, args=(child_conn, file_content, heading_criteria, memory_limit_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task = None; self.started_at = None
+
+    def assign(self, task):
+        self.task = task; self.started_at = time.monotonic()
+        self.conn.send(task)
+
+    def kill(self):
+        try: self.process.kill()
+        except Exception: pass
+        self.process.join(timeout=5)
+        self.conn.close()
+
+    def stop(self):
+        try: self.conn.send(None)
+        except (OSError, BrokenPipeError): pass
+        self.process.join(timeout=2)
+        if self.process.is_alive(): self.kill()
+
+
+def iter_pages_supervised(
+    file_name, file_content, heading_criteria,
+    start_skip=0, end_skip=0, start_page_offset=1,
+    n_workers=2, page_timeout=DEFAULT_PAGE_TIMEOUT, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, start_method="spawn",
+    failed_pages=None
+    ):
+    """
+    Supervised counterpart of file_processor.iter_page_items: yields the items of each PDF page in
+    page order, extracted in worker processes. Pages that time out, exceed the memory limit or crash
+    their worker yield nothing, are appended to failed_pages ({'page_number', 'reason'}) and the
+    worker is replaced. DOCX files are extracted in-process as usual.
+    Raises ValueError if the file cannot be opened.
+    """
+    if failed_pages is None: failed_pages = []
+    if file_name.split('.')[-1].lower() != 'pdf':
+        yield from iter_page_items(file_name, file_content, heading_criteria, start_skip, end_skip, start_page_offset)
+        return
+
+    try:
+        with fitz.open(stream=file_content, filetype="pdf") as doc: total_pages = len(doc)
+    except Exception as e_main: raise ValueError(f"Main PDF Error: {e_main}")
+
+    page_order = list(range(start_skip, total_pages - end_skip))
+    if not page_order: return
+    pending = [(i, i - start_skip + start_page_offset) for i in reversed(page_order)] # pop() from the end keeps page order
+    done_pages = {} # page_index -> items (empty for failed pages), until their turn to be yielded
+    next_page = 0
+    ctx = multiprocessing.get_context(start_method)
+    workers = [_Worker(ctx, file_content, heading_criteria, memory_limit_mb) for _ in range(max(1, min(n_workers, len(pending))))]
+
+    def fail(worker, reason):
+        page_index, page_marker = worker.task
+        print(f"Error processing PDF page {page_marker}: {reason}")
+        failed_pages.append({"page_number": page_marker, "reason": reason})
+        done_pages[page_index] = []; worker.task = None
+
+    try:
+        while pending or any(w.task for w in workers):
+            for i, worker in enumerate(workers): # Hand out work; replace dead workers first
+                if not worker.process.is_alive() and worker.task is None:
+                    worker.kill(); workers[i] = worker = _Worker(ctx, file_content, heading_criteria, memory_limit_mb)
+                if worker.task is None and pending: worker.assign(pending.pop())
+
+            busy = [w for w in workers if w.task]
+            now = time.monotonic()
+            next_deadline = min(w.started_at + page_timeout for w in busy)
+            ready = wait([w.conn for w in busy] + [w.process.sentinel for w in busy], timeout=max(0.0, next_deadline - now))
+
+            for i, worker in enumerate(workers):
+                if not worker.task: continue
+                if worker.conn in ready:
+                    try: status, page_index, payload = worker.conn.recv()
+                    except (EOFError, OSError): status, payload = "crash", None
+                    if status == "ok": done_pages[page_index] = payload; worker.task = None; continue
+                    if status == "error": fail(worker, payload); continue
+                if not worker.process.is_alive(): # Segfault, OOM kill, ...
+                    fail(worker, f"worker crashed (exit code {worker.process.exitcode})")
+                    worker.kill(); workers[i] = _Worker(ctx, file_content, heading_criteria, memory_limit_mb)
+                elif time.monotonic() - worker.started_at > page_timeout:
+                    fail(worker, f"timed out after {page_timeout:.0f}s")
+                    worker.kill(); workers[i] = _Worker(ctx, file_content, heading_criteria, memory_limit_mb)
+
+            while next_page < len(page_order) and page_order[next_page] in done_pages: # Yield finished pages in order
+                yield done_pages.pop(page_order[next_page]); next_page += 1
+    finally:
+        for worker in workers: worker.stop()
+
+
+def extract_sentences_supervised(
+    file_name, file_content, heading_criteria,
+    start_skip=0, end_skip=0, start_page_offset=1,
+    n_workers=2, page_timeout=DEFAULT_PAGE_TIMEOUT, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, start_method="spawn"
+    ):
+    """
+    Same items as extract_sentences_with_structure, but each PDF page is extracted in a supervised
+    worker process (see iter_pages_supervised).
+    Output: (extracted_data, failed_pages) with failed_pages [{'page_number': ..., 'reason': ...}];
+            (None, []) if the file cannot be opened.
+    """
+    failed_pages = []
+    try:
+        extracted_data = [item for page_items in iter_pages_supervised(
+            file_name, file_content, heading_criteria, start_skip, end_skip, start_page_offset,
+            n_workers, page_timeout, memory_limit_mb, start_method, failed_pages
+        ) for item in page_items]
+    except ValueError as e_main: print(e_main); return None, []
+    failed_pages.sort(key=lambda f: f["page_number"])
+    print(f"Supervised extraction complete. Found {len(extracted_data)} items, {len(failed_pages)} failed pages.")
+    return extracted_data, failed_pages
+# --- END OF FILE safe_extraction.py ---
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+import tiktoken
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def tokenizer():
+    """Byte-level BPE with a few merges; behaves like cl100k_base without downloading it."""
+    ranks = {bytes([i]): i for i in range(256)}
+    for j, merge in enumerate([b"th", b"he", b"the", b" t", b"in", b"an", b"al", b" a"]): ranks[merge] = 256 + j
+    return tiktoken.Encoding(
+        name="test_bytes",
+        pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+        mergeable_ranks=ranks, special_tokens={}
+    )
@@ -0,0 +1,40 @@
+import io
+import json
+
+import pytest
+
+from chunk_service import ChunkRequestHandler
+
+
+class _Service:
+    def resolve_path(self, path):
+        return "/books/book.pdf" if path else None
+
+
+def _parse(body, content_length=None, query=""):
+    handler = object.__new__(ChunkRequestHandler)
+    handler.path = f"/chunk{query}"
+    handler.headers = {"Content-Type": "application/json", "Content-Length": str(len(body) if content_length is None else content_length)}
+    handler.rfile = io.BytesIO(body)
+    handler.service = _Service()
+    return handler._parse_request()
+
+
+def test_valid_request():
+    _, _, path, _, params = _parse(json.dumps({"path": "book.pdf", "target_tokens": 120, "overlap_tokens": 0}).encode())
+    assert path == "/books/book.pdf" and params == {"mode": "token", "target_tokens": 120, "overlap_tokens": 0}
+
+
+@pytest.mark.parametrize("options", [
+    {"path": "book.pdf", "target_tokens": 0}, {"path": "book.pdf", "target_tokens": -3},
+    {"path": "book.pdf", "overlap_sentences": -1}, {"path": "book.pdf", "start_skip": -2},
+    {"path": "book.pdf", "target_tokens": "many"}, [1]
+])
+def test_bad_parameters_are_rejected(options):
+    with pytest.raises(ValueError):
+        _parse(json.dumps(options).encode())
+
+
+def test_negative_content_length_is_rejected():
+    with pytest.raises(ValueError):
+        _parse(b'{"path": "book.pdf"}', content_length=-5)
@@ -0,0 +1,73 @@
+import sys
+import sqlite3
+from unittest import mock
+
+import pandas as pd
+
+from chunk_store import open_chunk_store, insert_chunks, search_chunks, source_from_export_name, main
+
+
+def _chunks(prefix, n, with_ids=True):
+    return [{**({"chunk_id": f"p1_c{i}"} if with_ids else {}), "chunk_text": f"{prefix} chunk number {i}", "page_number": 1, "title": "One"}
+            for i in range(n)]
+
+
+def _rows(conn, source):
+    return conn.execute("SELECT chunk_id, chunk_text FROM chunks WHERE source = ? ORDER BY chunk_id", (source,)).fetchall()
+
+
+def test_same_chunk_ids_in_two_books(tmp_path):
+    conn = open_chunk_store(str(tmp_path / "chunks.db"))
+    insert_chunks(conn, _chunks("apple", 3), "a.pdf")
+    insert_chunks(conn, _chunks("banana", 3), "b.pdf")
+    assert [text for _, text in _rows(conn, "a.pdf")] == [f"apple chunk number {i}" for i in range(3)]
+    assert [text for _, text in _rows(conn, "b.pdf")] == [f"banana chunk number {i}" for i in range(3)]
+    assert {r["source"] for r in search_chunks(conn, "apple")} == {"a.pdf"}
+
+
+def test_rerun_with_fewer_chunks_removes_stale_rows(tmp_path):
+    conn = open_chunk_store(str(tmp_path / "chunks.db"))
+    for with_ids in (True, False):
+        insert_chunks(conn, _chunks("apple", 5, with_ids), "a.pdf")
+        insert_chunks(conn, _chunks("banana", 2), "b.pdf")
+        insert_chunks(conn, _chunks("cherry", 2, with_ids), "a.pdf")
+        assert [text for _, text in _rows(conn, "a.pdf")] == ["cherry chunk number 0", "cherry chunk number 1"]
+        assert len(_rows(conn, "b.pdf")) == 2
+        assert search_chunks(conn, "apple") == []
+        assert len(search_chunks(conn, "cherry")) == 2
+
+
+def test_migrates_store_with_global_chunk_ids(tmp_path):
+    db_path = str(tmp_path / "old.db")
+    old = sqlite3.connect(db_path)
+    old.executescript("""
+        CREATE TABLE chunks (chunk_id TEXT PRIMARY KEY, source TEXT, page_number TEXT, title TEXT, token_count INTEGER, chunk_text TEXT NOT NULL);
+        CREATE INDEX chunks_source ON chunks(source);
+        CREATE VIRTUAL TABLE chunks_fts USING fts5(chunk_text, title, content='chunks', content_rowid='rowid');
+        CREATE TRIGGER chunks_ai AFTER INSERT ON chunks BEGIN
+            INSERT INTO chunks_fts(rowid, chunk_text, title) VALUES (new.rowid, new.chunk_text, new.title);
+        END;
+        INSERT INTO chunks VALUES ('p1_c0', 'a.pdf', '1', 'One', 4, 'apple chunk number 0');
+    """)
+    old.close()
+    conn = open_chunk_store(db_path)
+    insert_chunks(conn, _chunks("banana", 1), "b.pdf")
+    assert [r["source"] for r in search_chunks(conn, "apple")] == ["a.pdf"]
+    assert [r["source"] for r in search_chunks(conn, "banana")] == ["b.pdf"]
+
+
+def test_ingest_uses_the_app_source_name(tmp_path):
+    assert source_from_export_name("/downloads/book.pdf_chunks_v15.csv") == "book.pdf"
+    assert source_from_export_name("book.pdf_chunks_v15 (1).csv") == "book.pdf"
+    assert source_from_export_name("notes.csv") is None
+
+    db_path = str(tmp_path / "chunks.db")
+    conn = open_chunk_store(db_path)
+    insert_chunks(conn, _chunks("apple", 3, with_ids=False), "book.pdf") # As stored by the app
+    conn.close()
+    csv_path = tmp_path / "book.pdf_chunks_v15.csv"
+    pd.DataFrame(_chunks("apple", 2, with_ids=False)).to_csv(csv_path, index=False)
+    with mock.patch.object(sys, "argv", ["chunk_store.py", "ingest", db_path, str(csv_path)]): main()
+    conn = open_chunk_store(db_path)
+    assert conn.execute("SELECT DISTINCT source FROM chunks").fetchall() == [("book.pdf",)]
+    assert len(_rows(conn, "book.pdf")) == 2
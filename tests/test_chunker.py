@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from chunker import split_token_windows, chunk_structured_sentences, chunk_hierarchical
+from document_model import DocumentText, chunk_document, iter_span_records
+from test_incremental import _random_items
+
+ITEMS = [("One", 1, "One"), ("alpha beta gamma.", 1, None), ("delta epsilon.", 2, None)]
+
+
+@pytest.mark.parametrize("target_tokens", [0, -5])
+def test_target_tokens_below_one_is_rejected(tokenizer, target_tokens):
+    with pytest.raises(ValueError):
+        split_token_windows(tokenizer.encode("alpha beta gamma"), tokenizer, target_tokens)
+    with pytest.raises(ValueError):
+        chunk_structured_sentences(ITEMS, tokenizer, target_tokens, 1)
+    with pytest.raises(ValueError):
+        chunk_document(DocumentText.from_items(ITEMS), tokenizer, target_tokens, 1)
+
+
+def test_token_chunkers_agree(tokenizer):
+    for seed in range(60):
+        items = _random_items(random.Random(seed), random.Random(seed).randint(1, 250))
+        items.insert(len(items) // 2, ("One", 0, "One")); items.insert(len(items) // 2, ("One", 0, "One")) # Repeated heading
+        for overlap in ({}, {"overlap_tokens": 25, "overlap_cap_tokens": 45}):
+            flat = [(c["chunk_text"], c["title"]) for c in chunk_structured_sentences(items, tokenizer, 60, 2, 5, **overlap)]
+            doc = DocumentText.from_items(items)
+            compact = [(r["chunk_text"], r["title"]) for r in iter_span_records(doc, chunk_document(doc, tokenizer, 60, 2, 5, **overlap))]
+            hierarchy = chunk_hierarchical(items, tokenizer, 60, 2, 5, **overlap)
+            children = [(c["chunk_text"], c["title"]) for c in hierarchy["children"]]
+            assert flat == compact == children, (seed, overlap)
+
+
+def test_repeated_heading_does_not_split_a_parent(tokenizer):
+    items = [("One", 1, "One"), ("a.", 1, None), ("b.", 1, None), ("One", 2, "One"), ("c.", 2, None)]
+    hierarchy = chunk_hierarchical(items, tokenizer, 60, 1)
+    assert len(hierarchy["parents"]) == 1
+    assert [c["chunk_text"] for c in hierarchy["children"]] == ["a. b. c."]
@@ -0,0 +1,94 @@
+import random
+
+import fitz
+import nltk
+
+from chunker import chunk_incremental, chunk_structured_sentences
+from file_processor import page_content_hash, extract_sentences_incremental
+from tokenizer_registry import ApproximateTokenizer
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa".split()
+HEADING_CRITERIA = { # Only lines matching "^Chapter" are headings
+    "require_bold": False, "require_italic": False, "require_title_case": False, "require_all_caps": False,
+    "require_centered": False, "require_isolated": False, "min_words": 1, "max_words": 10, "keyword_pattern": "^Chapter",
+    "use_style": False, "use_case": False, "use_layout": False, "use_length": False, "use_keywords": True
+}
+
+
+def _form_xobject_pdf(texts):
+    """Each page only draws 'q /fzFrm0 Do Q'; the text lives in a Form XObject."""
+    src = fitz.open()
+    for text in texts: src.new_page().insert_text((72, 72), text)
+    out = fitz.open()
+    for i in range(len(texts)):
+        page = out.new_page(); page.show_pdf_page(page.rect, src, i)
+    return out.tobytes()
+
+
+def test_page_hash_sees_form_xobjects():
+    doc = fitz.open(stream=_form_xobject_pdf(["Alpha page text", "Beta page text", "Gamma page text"]), filetype="pdf")
+    hashes = {page_content_hash(doc, page, "criteria") for page in doc}
+    assert len(hashes) == 3
+
+
+def test_incremental_extraction_of_form_xobject_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(nltk, "sent_tokenize", lambda text: [text])
+    texts = ["Alpha page text", "Beta page text", "Gamma page text"]
+    items, stats = extract_sentences_incremental("book.pdf", _form_xobject_pdf(texts), HEADING_CRITERIA, str(tmp_path))
+    assert [text for text, _, _ in items] == texts
+    assert stats["extracted_pages"] == 3
+
+    revised = ["Alpha page text", "Delta page text", "Gamma page text"]
+    items, stats = extract_sentences_incremental("book.pdf", _form_xobject_pdf(revised), HEADING_CRITERIA, str(tmp_path))
+    assert [text for text, _, _ in items] == revised
+    assert stats["reused_pages"] == 2 and stats["extracted_pages"] == 1
+
+
+def _random_items(rng, n):
+    items = []
+    for i in range(n):
+        x = rng.random()
+        if x < 0.03:
+            title = rng.choice(["One", "Two", "Three"]); items.append((title, i // 20, title))
+        elif x < 0.05:
+            items.append((" ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 90))), i // 20, None))
+        else:
+            items.append((" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12))) + ".", i // 20, None))
+    return items
+
+
+def _edit(rng, items):
+    edited = list(items)
+    at = rng.randrange(len(edited))
+    action = rng.choice(["replace", "insert", "delete"])
+    new_item = (" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12))) + ".", edited[at][1], None)
+    if action == "replace": edited[at] = new_item
+    elif action == "insert": edited.insert(at, new_item)
+    elif len(edited) > 1: del edited[at]
+    return edited
+
+
+def _strip(chunks):
+    return [{k: c[k] for k in ("chunk_text", "page_number", "title", "item_start", "item_end")} for c in chunks]
+
+
+def test_incremental_matches_full_run(tokenizer):
+    for seed in range(60):
+        rng = random.Random(seed)
+        items = _random_items(rng, rng.randint(20, 250))
+        for overlap in ({}, {"overlap_tokens": 25, "overlap_cap_tokens": 45}):
+            _, manifest, _ = chunk_incremental(items, tokenizer, 60, 2, oversize_overlap_tokens=5, **overlap)
+            edited = _edit(rng, items)
+            chunks, _, stats = chunk_incremental(edited, tokenizer, 60, 2, previous_manifest=manifest, oversize_overlap_tokens=5, **overlap)
+            full = chunk_structured_sentences(edited, tokenizer, 60, 2, 5, with_item_spans=True, **overlap)
+            assert _strip(chunks) == _strip(full), (seed, overlap, stats)
+
+
+def test_recalibrated_approximate_tokenizer_reuses_nothing():
+    items = _random_items(random.Random(7), 120)
+    _, manifest, _ = chunk_incremental(items, ApproximateTokenizer(0.25, 0.0), 60, 2)
+    _, _, stats = chunk_incremental(items, ApproximateTokenizer(0.25, 0.0), 60, 2, previous_manifest=manifest)
+    assert stats["new_chunks"] == 0
+    chunks, _, stats = chunk_incremental(items, ApproximateTokenizer(0.31, 0.1), 60, 2, previous_manifest=manifest)
+    assert stats["reused_chunks"] == 0
+    assert _strip(chunks) == _strip(chunk_structured_sentences(items, ApproximateTokenizer(0.31, 0.1), 60, 2, with_item_spans=True))
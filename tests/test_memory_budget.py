@@ -0,0 +1,40 @@
+import time
+
+import memory_budget
+from memory_budget import StageMemory, current_rss_mb
+
+
+def _allocate(mb):
+    block = bytearray(mb * 1024 * 1024)
+    block[::4096] = b"x" * len(block[::4096]) # Touch every page so it is resident
+    time.sleep(0.05) # Long enough for the fallback sampler to see it
+    return block
+
+
+def _check_stage_peaks(meter):
+    baseline = current_rss_mb()
+    with meter.stage("big"): block = _allocate(96); del block
+    with meter.stage("small"): block = _allocate(4); del block
+    peaks = {s["stage"]: s["peak_rss_mb"] for s in meter.report()}
+    assert peaks["big"] >= baseline + 80
+    assert peaks["small"] < peaks["big"] - 60 # Not the lifetime peak left behind by "big"
+
+
+def test_stage_peak_is_reset_between_stages():
+    _check_stage_peaks(StageMemory())
+
+
+def test_stage_peak_sampled_without_reset(monkeypatch):
+    monkeypatch.setattr(memory_budget, "reset_peak_rss", lambda: False)
+    monkeypatch.setattr(memory_budget, "SAMPLE_INTERVAL", 0.002)
+    _check_stage_peaks(StageMemory())
+
+
+def test_concurrent_stage_does_not_wipe_a_running_peak(monkeypatch):
+    resets = []
+    monkeypatch.setattr(memory_budget, "reset_peak_rss", lambda: resets.append(1) or True)
+    outer, inner = StageMemory(), StageMemory()
+    with outer.stage("outer"):
+        with inner.stage("inner"): time.sleep(0.02) # Another session's stage while "outer" runs
+    assert len(resets) == 1 # Only the stage that started alone reset the mark
+    assert inner.report()[0]["peak_rss_mb"] is not None # Sampled instead
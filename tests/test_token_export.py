@@ -0,0 +1,13 @@
+from token_export import export_token_ids, load_token_ids
+
+
+def test_export_from_a_stream_matches_a_list(tmp_path, tokenizer):
+    chunks = [{"chunk_text": f"the chunk number {i} " * (i % 7 + 1), "page_number": i // 3, "title": "One"} for i in range(1100)]
+    list_header = export_token_ids(chunks, tokenizer, str(tmp_path / "list"))
+    stream_header = export_token_ids(iter(chunks), tokenizer, str(tmp_path / "stream"))
+    assert list_header == stream_header and stream_header["n_chunks"] == len(chunks)
+
+    ids, offsets, metadata, _ = load_token_ids(str(tmp_path / "stream"))
+    assert len(offsets) == len(chunks) + 1 and len(metadata) == len(chunks)
+    for i in (0, 511, 512, 1099):
+        assert tokenizer.decode(list(ids[offsets[i]:offsets[i + 1]])) == chunks[i]["chunk_text"]
@@ -0,0 +1,81 @@
+# --- START OF FILE token_export.py ---
+"""
+Pre-tokenized chunk export: token ids of all chunks in one flat binary file that downstream
+jobs can np.memmap without re-tokenizing.
+
+Files written for an output prefix:
+    <prefix>.bin          flat token ids, little-endian uint16/uint32 (see header)
+    <prefix>.offsets.npy  int64 array of n_chunks + 1; chunk i is ids[offsets[i]:offsets[i+1]]
+    <prefix>.meta.jsonl   one JSON object per chunk (chunk_id, page_number, title, source, token_count)
+    <prefix>.json         header: encoding name, dtype, chunk and token counts
+"""
+import json
+from array import array
+from itertools import islice
+
+import numpy as np
+
+EXPORT_BATCH_SIZE = 512 # Chunks encoded per encode_ordinary_batch call
+
+
+def _encode_batch(tokenizer, texts):
+    if hasattr(tokenizer, "encode_ordinary_batch"): return tokenizer.encode_ordinary_batch(texts) # tiktoken, multi-threaded
+    if hasattr(tokenizer, "encode_ordinary"): return [tokenizer.encode_ordinary(t) for t in texts]
+    return [tokenizer.encode(t) for t in texts]
+
+
+def export_token_ids(chunks, tokenizer, out_prefix, source=None):
+    """
+    Writes the token ids of every chunk plus offsets and a metadata sidecar.
+    Input: Iterable of chunk dictionaries (needs 'chunk_text'; 'chunk_id', 'page_number', 'title' used if present);
+           it is read in batches, so a streaming reader keeps memory flat.
+    Output: Header dictionary, or None if the tokenizer has no integer token ids.
+    """
+    if getattr(tokenizer, "name", None) == "approximate":
+        print("ERROR: Token id export needs a real tokenizer, not approximate counting."); return None
+    n_vocab = getattr(tokenizer, "n_vocab", None)
+    dtype = np.dtype("<u2") if n_vocab is not None and n_vocab <= 65536 else np.dtype("<u4")
+
+    offsets = array("q", [0])
+    chunk_iter = iter(chunks)
+    with open(f"{out_prefix}.bin", "wb") as ids_file, open(f"{out_prefix}.meta.jsonl", "w", encoding="utf-8") as meta_file:
+        while True:
+            batch = list(islice(chunk_iter, EXPORT_BATCH_SIZE))
+            if not batch: break
+            for chunk, ids in zip(batch, _encode_batch(tokenizer, [c["chunk_text"] for c in batch])):
+                i = len(offsets) - 1
+                np.asarray(ids, dtype=dtype).tofile(ids_file)
+                offsets.append(offsets[-1] + len(ids))
+                meta_file.write(json.dumps({
+                    "chunk_id": chunk.get("chunk_id", i),
+                    "page_number": chunk.get("page_number"),
+                    "title": chunk.get("title"),
+                    "source": source,
+                    "token_count": len(ids)
+                }, ensure_ascii=False, default=str) + "\n")
+    offsets = np.frombuffer(offsets, dtype=np.int64)
+    np.save(f"{out_prefix}.offsets.npy", offsets)
+
+    header = {
+        "encoding": getattr(tokenizer, "name", None),
+        "dtype": dtype.str, # e.g. '<u4'
+        "n_chunks": len(offsets) - 1,
+        "n_tokens": int(offsets[-1]),
+        "source": source
+    }
+    with open(f"{out_prefix}.json", "w", encoding="utf-8") as f: json.dump(header, f, ensure_ascii=False, indent=2)
+    return header
+
+
+def load_token_ids(out_prefix):
+    """
+    Zero-copy loader for export_token_ids output.
+    Output: (ids memmap, offsets array, list of metadata dictionaries, header)
+    """
+    with open(f"{out_prefix}.json", encoding="utf-8") as f: header = json.load(f)
+    dtype = np.dtype(header["dtype"])
+    ids = np.memmap(f"{out_prefix}.bin", dtype=dtype, mode="r") if header["n_tokens"] else np.zeros(0, dtype=dtype)
+    offsets = np.load(f"{out_prefix}.offsets.npy", mmap_mode="r")
+    with open(f"{out_prefix}.meta.jsonl", encoding="utf-8") as f: metadata = [json.loads(line) for line in f if line.strip()]
+    return ids, offsets, metadata, header
+# --- END OF FILE token_export.py ---
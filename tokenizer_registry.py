@@ -0,0 +1,148 @@
+# --- START OF FILE tokenizer_registry.py ---
+import os
+import re
+import tiktoken
+
+try:
+    from tokenizers import Tokenizer as HFTokenizer # Optional: only needed for tokenizer.json files
+except ImportError:
+    HFTokenizer = None
+
+DEFAULT_TOKENIZER = "cl100k_base"
+APPROXIMATE_TOKENIZER = "approximate"
+
+_TOKENIZER_CACHE = {} # One instance per tokenizer name/path per process
+_WORD_RE = re.compile(r"\S+")
+
+
+# --- HuggingFace tokenizer.json Adapter ---
+def _byte_level_decoder_map():
+    """Inverse of the GPT-2 bytes_to_unicode table used by byte-level BPE vocabularies."""
+    byte_values = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    char_values = byte_values[:]
+    n = 0
+    for b in range(256):
+        if b not in byte_values:
+            byte_values.append(b); char_values.append(256 + n); n += 1
+    return {chr(c): b for b, c in zip(byte_values, char_values)}
+
+
+class HuggingFaceTokenizer:
+    """ Wraps a local tokenizer.json so it offers the tiktoken methods the chunker uses. """
+    def __init__(self, path):
+        if HFTokenizer is None: raise ImportError("The 'tokenizers' package is required for tokenizer.json files.")
+        self.name = path
+        self._tok = HFTokenizer.from_file(path)
+        self._byte_map = _byte_level_decoder_map() if '"ByteLevel"' in self._tok.to_str() else None
+
+    def encode(self, text):
+        return self._tok.encode(text, add_special_tokens=False).ids
+
+    def decode(self, token_ids):
+        return self._tok.decode(list(token_ids))
+
+    def decode_tokens_bytes(self, token_ids):
+        if self._byte_map is not None: # Byte-level BPE: every token maps to exact bytes
+            return [bytes(self._byte_map[ch] for ch in self._tok.id_to_token(i)) for i in token_ids]
+        return [self._tok.decode([i]).encode("utf-8") for i in token_ids] # Best effort for WordPiece/Unigram
+
+
+# --- Approximate Counting ---
+class ApproximateTokenizer:
+    """
+    Estimates token counts from character and word counts (tokens ~ a*chars + b*words)
+    without any BPE encoding. encode() returns the text cut into that many pieces, so
+    the chunker (including oversize splitting) works unchanged on the pieces.
+    """
+    def __init__(self, chars_coef=0.25, words_coef=0.0, error_stats=None):
+        self.name = APPROXIMATE_TOKENIZER
+        self.chars_coef = chars_coef
+        self.words_coef = words_coef
+        self.error_stats = error_stats or {} # Filled by calibrate_approximate_tokenizer
+
+    def count(self, text):
+        if not text: return 0
+        estimate = self.chars_coef * len(text) + self.words_coef * len(_WORD_RE.findall(text))
+        return max(1, int(round(estimate)))
+
+    def encode(self, text):
+        n_pieces = self.count(text)
+        if n_pieces == 0: return []
+        step = len(text) / n_pieces
+        cuts = [int(round(k * step)) for k in range(n_pieces)] + [len(text)]
+        return [text[cuts[k]:cuts[k + 1]] for k in range(n_pieces)]
+
+    def decode(self, pieces):
+        return "".join(pieces)
+
+    def decode_tokens_bytes(self, pieces):
+        return [p.encode("utf-8") for p in pieces]
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def calibrate_approximate_tokenizer(sample_texts, reference_tokenizer, max_samples=500):
+    """
+    Fits the char/word coefficients on a sample of the document against an exact tokenizer.
+    Input: List of texts (e.g. extracted sentences), exact tokenizer.
+    Output: ApproximateTokenizer with error_stats {'samples', 'mean_abs_rel_error',
+            'p95_abs_rel_error', 'max_abs_rel_error', 'total_rel_error'}
+    """
+    texts = [t for t in sample_texts if t and t.strip()]
+    if len(texts) > max_samples: # Evenly spaced sample across the whole document
+        stride = len(texts) / max_samples
+        texts = [texts[int(k * stride)] for k in range(max_samples)]
+    if not texts: return ApproximateTokenizer()
+
+    chars = [len(t) for t in texts]
+    words = [len(_WORD_RE.findall(t)) for t in texts]
+    exact = [len(reference_tokenizer.encode(t)) for t in texts]
+
+    # Least squares for exact ~ a*chars + b*words (2x2 normal equations)
+    scc = sum(c * c for c in chars); sww = sum(w * w for w in words); scw = sum(c * w for c, w in zip(chars, words))
+    sce = sum(c * e for c, e in zip(chars, exact)); swe = sum(w * e for w, e in zip(words, exact))
+    det = scc * sww - scw * scw
+    if det > 0:
+        chars_coef = (sce * sww - swe * scw) / det
+        words_coef = (swe * scc - sce * scw) / det
+    else:
+        chars_coef = sum(exact) / max(1, sum(chars)); words_coef = 0.0
+
+    approx = ApproximateTokenizer(chars_coef, words_coef)
+    estimates = [approx.count(t) for t in texts]
+    rel_errors = sorted(abs(est - ex) / ex for est, ex in zip(estimates, exact) if ex > 0)
+    approx.error_stats = {
+        "samples": len(texts),
+        "mean_abs_rel_error": sum(rel_errors) / len(rel_errors) if rel_errors else 0.0,
+        "p95_abs_rel_error": _percentile(rel_errors, 0.95),
+        "max_abs_rel_error": rel_errors[-1] if rel_errors else 0.0,
+        "total_rel_error": (sum(estimates) - sum(exact)) / sum(exact) if sum(exact) else 0.0,
+    }
+    return approx
+
+
+# --- Registry ---
+def available_tokenizers():
+    """Names accepted by load_tokenizer (a tokenizer.json path is accepted as well)."""
+    return tiktoken.list_encoding_names() + [APPROXIMATE_TOKENIZER]
+
+
+def load_tokenizer(name=DEFAULT_TOKENIZER):
+    """
+    Returns a cached tokenizer for a tiktoken encoding name, a local tokenizer.json path,
+    or 'approximate' (uncalibrated; see calibrate_approximate_tokenizer).
+    """
+    name = (name or DEFAULT_TOKENIZER).strip()
+    if name in _TOKENIZER_CACHE: return _TOKENIZER_CACHE[name]
+    if name == APPROXIMATE_TOKENIZER:
+        tokenizer = ApproximateTokenizer()
+    elif name.endswith(".json") or os.path.isfile(name):
+        tokenizer = HuggingFaceTokenizer(name)
+    else:
+        tokenizer = tiktoken.get_encoding(name)
+    _TOKENIZER_CACHE[name] = tokenizer
+    return tokenizer
+# --- END OF FILE tokenizer_registry.py ---
@@ -1,7 +1,7 @@
 # --- START OF FILE utils.py ---
 import streamlit as st
 import nltk
-import tiktoken
+from tokenizer_registry import load_tokenizer, DEFAULT_TOKENIZER
 
 @st.cache_resource # Cache the download status
 def ensure_nltk_data():
@@ -26,10 +26,10 @@ def ensure_nltk_data():
     return data_ok
 
 @st.cache_resource
-def get_tokenizer():
-    """Initializes and returns the tokenizer."""
+def get_tokenizer(name=DEFAULT_TOKENIZER):
+    """Initializes and returns the tokenizer (tiktoken encoding, tokenizer.json path or 'approximate')."""
     try:
-        return tiktoken.get_encoding("cl100k_base")
+        return load_tokenizer(name)
     except Exception as e:
         st.error(f"Error initializing tokenizer: {e}")
         return None